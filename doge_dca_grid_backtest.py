@@ -1,111 +1,252 @@
 
+import itertools
+from functools import lru_cache
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
 from pathlib import Path
 
-def backtest_dca_grid(csv_path,
-                      base_order_usdt=10.0,
-                      safety_orders=12,
-                      step_pct=0.015,
-                      volume_scale=1.4,
-                      tp_pct=0.008,
-                      max_position_usdt=500.0,
-                      start_equity=1000.0,
-                      plot_path=None,
-                      trades_csv=None,
-                      summary_json=None):
-    df = pd.read_csv(csv_path)
-    df.columns = [c.strip().lower() for c in df.columns]
-    close_col = None
-    for c in ['close','closing price','close_price','c']:
-        if c in df.columns:
-            close_col = c; break
-    time_col = None
-    for c in ['timestamp','time','open time','open_time','date']:
-        if c in df.columns:
-            time_col = c; break
-    if close_col is None:
-        raise ValueError("No close column in CSV")
-    if time_col is not None:
-        try:
-            t = pd.to_datetime(df[time_col])
-        except Exception:
-            try:
-                t = pd.to_datetime(df[time_col], unit='ms')
-            except Exception:
-                t = pd.RangeIndex(len(df), name='bar')
-    else:
-        t = pd.RangeIndex(len(df), name='bar')
-    df = pd.DataFrame({'time': t, 'close': df[close_col].astype(float)}).dropna().reset_index(drop=True)
+try:
+    from numba import njit, prange
+    _HAVE_NUMBA = True
+except ImportError:  # numba is optional; the kernel then runs as plain Python
+    _HAVE_NUMBA = False
+    prange = range
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda fn: fn
+
+@njit(cache=True, fastmath=True, inline='always')
+def _run(closes, base_order_usdt, safety_orders, step_pct, volume_scale,
+         tp_pct, max_position_usdt, start_equity):
+    # Per-bar DCA state machine. Everything is a plain float/int/bool so numba
+    # can type it: "no position" is has_pos=False and "no pending safety
+    # order" is ladder_open=False instead of None sentinels.
+    n = len(closes)
+    equity_out = np.empty(n)
+    trade_pnl = np.empty(n)
+    trade_levels = np.empty(n, np.int32)
+    trade_exit_idx = np.empty(n, np.int64)
+    trade_avg = np.empty(n)
+    ntrades = 0
 
     equity = start_equity
-    equity_curve = []
+    has_pos = False
+    ladder_open = False
     pos_qty = 0.0
-    avg_entry = None
+    avg_entry = 0.0
+    pos_cost = 0.0   # pos_qty * avg_entry, refreshed on fills only
     level = -1
-    next_buy_price = None
-    last_fill_price = None
-    size_usdt = base_order_usdt
-
-    trades = []
-    max_dd = 0.0; peak = equity
+    next_buy_price = 0.0
+    tp_trigger = 0.0
+    # order sizes are geometric in the level, so build the ladder once per run
+    size_tbl = np.empty(max(safety_orders, 1) + 1)
+    size_tbl[0] = base_order_usdt
+    for k in range(1, size_tbl.shape[0]):
+        size_tbl[k] = size_tbl[k - 1] * volume_scale
+    step_factor = 1 - step_pct; tp_factor = 1 + tp_pct
     deepest_level = 0; largest_pos_usdt = 0.0
 
-    def qty_from_usdt(usdt, price):
-        return usdt / price
+    for i in range(n):
+        price = float(closes[i])
+        equity_out[i] = equity + (price * pos_qty - pos_cost)   # 0 when flat
 
-    for _, row in df.iterrows():
-        price = float(row['close']); tm = row['time']
-        unrealized = (price - avg_entry) * pos_qty if pos_qty else 0.0
-        eq_now = equity + unrealized
-        equity_curve.append((tm, eq_now))
-        if eq_now > peak: peak = eq_now
-        dd = eq_now - peak
-        if dd < max_dd: max_dd = dd
-
-        if pos_qty == 0:
-            qty = qty_from_usdt(base_order_usdt, price)
+        if not has_pos:
             if base_order_usdt <= max_position_usdt:
-                pos_qty += qty; avg_entry = price; level = 0
-                size_usdt = base_order_usdt
-                last_fill_price = price
-                next_buy_price = last_fill_price * (1 - step_pct)
+                pos_qty = base_order_usdt / price; avg_entry = price; level = 0
+                pos_cost = base_order_usdt
+                has_pos = True; ladder_open = True
+                next_buy_price = price * step_factor
+                tp_trigger = avg_entry * tp_factor
                 largest_pos_usdt = max(largest_pos_usdt, pos_qty * price)
                 deepest_level = max(deepest_level, level)
             continue
 
+        # most bars sit between the ladder and the TP: one compare pair, no fill
+        if price < tp_trigger and (price > next_buy_price or not ladder_open):
+            continue
+
         # TP check
-        if price >= avg_entry * (1 + tp_pct):
-            pnl = (price - avg_entry) * pos_qty
+        if price >= tp_trigger:
+            pnl = price * pos_qty - pos_cost
             equity += pnl
-            trades.append({'time_close': tm, 'pnl': pnl, 'levels': level+1, 'avg_entry': avg_entry, 'exit_price': price})
-            pos_qty = 0.0; avg_entry = None; level = -1
-            next_buy_price = None; last_fill_price = None; size_usdt = base_order_usdt
+            trade_pnl[ntrades] = pnl; trade_levels[ntrades] = level + 1
+            trade_exit_idx[ntrades] = i; trade_avg[ntrades] = avg_entry
+            ntrades += 1
+            has_pos = False; ladder_open = False
+            pos_qty = 0.0; avg_entry = 0.0; pos_cost = 0.0; level = -1
             continue
 
-        # Add safety order
-        if next_buy_price is not None and price <= next_buy_price and level + 1 < safety_orders:
-            next_usdt = size_usdt * volume_scale
-            current_notional = pos_qty * price
-            if current_notional + next_usdt <= max_position_usdt + 1e-9:
-                qty = qty_from_usdt(next_usdt, price)
-                pos_qty += qty
-                avg_entry = ((avg_entry * (pos_qty - qty)) + price * qty) / pos_qty
-                level += 1; size_usdt = next_usdt
-                last_fill_price = price
-                next_buy_price = last_fill_price * (1 - step_pct)
-                deepest_level = max(deepest_level, level)
-                largest_pos_usdt = max(largest_pos_usdt, pos_qty * price)
-            else:
-                next_buy_price = None
+        # Add safety order (ladder open and price <= next_buy_price here)
+        next_usdt = size_tbl[level + 1]
+        can_add = (level + 1 < safety_orders) & (pos_qty * price + next_usdt <= max_position_usdt + 1e-9)
+        if can_add:
+            qty = next_usdt / price
+            pos_qty += qty
+            pos_cost += next_usdt
+            avg_entry = pos_cost / pos_qty
+            level += 1
+            next_buy_price = price * step_factor
+            tp_trigger = avg_entry * tp_factor
+            deepest_level = max(deepest_level, level)
+            largest_pos_usdt = max(largest_pos_usdt, pos_qty * price)
+        else:
+            ladder_open = False   # exhausted or capped until the next TP
+
+    return (equity_out, trade_pnl, trade_levels, trade_exit_idx, trade_avg, ntrades,
+            deepest_level, largest_pos_usdt)
 
-    eq = pd.DataFrame(equity_curve, columns=['time','equity'])
+@lru_cache(maxsize=None)
+def _make_kernel(safety_orders):
+    # _run specialized for one safety_orders value: it is a frozen closure
+    # constant, so the ladder bound and table size fold at compile time.
+    # numba keys its on-disk cache on the closure value as well.
+    @njit(cache=True, fastmath=True)
+    def kernel(closes, base_order_usdt, step_pct, volume_scale, tp_pct,
+               max_position_usdt, start_equity):
+        return _run(closes, base_order_usdt, safety_orders, step_pct, volume_scale,
+                    tp_pct, max_position_usdt, start_equity)
+    return kernel
+
+def _load_csv(csv_path):
+    df = pd.read_csv(csv_path)
+    df.columns = [c.strip().lower() for c in df.columns]
+    close_col = next((c for c in ('close','closing price','close_price','c') if c in df.columns), None)
+    time_col = next((c for c in ('timestamp','time','open time','open_time','date') if c in df.columns), None)
+    if close_col is None:
+        raise ValueError("No close column in CSV")
+    if time_col is None:
+        t = pd.RangeIndex(len(df), name='bar')
+    elif pd.api.types.is_numeric_dtype(df[time_col]):
+        t = pd.to_datetime(df[time_col], unit='ms')   # exchange klines: epoch millis
+    else:
+        try:
+            t = pd.to_datetime(df[time_col], format='ISO8601', cache=True)
+        except ValueError:   # e.g. '01/01/2021 00:00': infer per element
+            t = pd.to_datetime(df[time_col], format='mixed', cache=True)
+    # drop incomplete rows with one boolean mask over the raw arrays rather
+    # than building a frame and copying it again through dropna/reset_index
+    times = t.to_numpy()
+    closes = df[close_col].to_numpy(dtype=np.float64)
+    mask = ~np.isnan(closes)
+    if times.dtype.kind == 'M':
+        mask &= ~np.isnat(times)
+    if mask.all():
+        return times, closes
+    return times[mask], closes[mask]
+
+def _load_prices(csv_path):
+    # Parsed (time, close) columns are cached as a sibling .parquet so sweeps
+    # over the same CSV skip text parsing; it is rebuilt when the CSV changes.
+    # Closes are handed out as float32 (plenty for DOGE quotes, half the
+    # memory per sweep worker); the kernel widens each read to float64.
+    csv_path = Path(csv_path)
+    pq = csv_path.with_suffix('.parquet')
+    if pq.exists() and pq.stat().st_mtime >= csv_path.stat().st_mtime:
+        df = pd.read_parquet(pq, columns=['time', 'close'])
+        return df['time'].to_numpy(), df['close'].to_numpy(dtype=np.float32)
+    times, closes = _load_csv(csv_path)
+    try:
+        pd.DataFrame({'time': times, 'close': closes}, copy=False).to_parquet(pq, compression='zstd')
+    except (ImportError, OSError):
+        pass
+    return times, closes.astype(np.float32)
+
+@njit(cache=True, parallel=True)
+def _sweep(closes, grid, base_order_usdt, max_position_usdt, start_equity):
+    # grid rows are (step_pct, tp_pct, volume_scale, safety_orders); configs are
+    # independent, so they run in parallel while each bar loop stays sequential
+    m = grid.shape[0]
+    out = np.empty((m, 7))
+    for k in prange(m):
+        (equity_out, trade_pnl, trade_levels, trade_exit_idx, trade_avg, ntrades,
+         deepest_level, largest_pos_usdt) = _run(
+            closes, base_order_usdt, int(grid[k, 3]), grid[k, 0], grid[k, 2],
+            grid[k, 1], max_position_usdt, start_equity)
+        peak = start_equity; max_dd = 0.0
+        for i in range(equity_out.shape[0]):
+            if equity_out[i] > peak: peak = equity_out[i]
+            if equity_out[i] - peak < max_dd: max_dd = equity_out[i] - peak
+        wins = 0
+        for j in range(ntrades):
+            if trade_pnl[j] > 0: wins += 1
+        out[k, 0] = ntrades
+        out[k, 1] = trade_pnl[:ntrades].sum()
+        out[k, 2] = wins / ntrades if ntrades else np.nan
+        out[k, 3] = max_dd
+        out[k, 4] = deepest_level
+        out[k, 5] = largest_pos_usdt
+        out[k, 6] = equity_out[-1] if equity_out.shape[0] else start_equity
+    return out
+
+def sweep(csv_path,
+          step_pct=(0.015,),
+          tp_pct=(0.008,),
+          volume_scale=(1.4,),
+          safety_orders=(12,),
+          base_order_usdt=10.0,
+          max_position_usdt=500.0,
+          start_equity=1000.0):
+    # Grid search over every combination of the four sequences; the CSV is
+    # loaded once and shared by all configs. Returns one summary row per config.
+    _, closes = _load_prices(csv_path)
+    grid = np.array(list(itertools.product(step_pct, tp_pct, volume_scale, safety_orders)),
+                    dtype=np.float64).reshape(-1, 4)
+    res = _sweep(closes if _HAVE_NUMBA else closes.tolist(), grid, float(base_order_usdt), float(max_position_usdt), float(start_equity))
+    out = pd.DataFrame(grid, columns=['step_pct', 'tp_pct', 'volume_scale', 'safety_orders'])
+    out['safety_orders'] = out['safety_orders'].astype(int)
+    for j, name in enumerate(['trades_closed', 'total_pnl', 'win_rate', 'max_drawdown_abs',
+                              'deepest_level_hit', 'largest_position_usdt', 'ending_equity']):
+        out[name] = res[:, j]
+    out['trades_closed'] = out['trades_closed'].astype(int)
+    out['deepest_level_hit'] = out['deepest_level_hit'].astype(int)
+    out['max_drawdown_pct'] = out['max_drawdown_abs'] / start_equity * 100.0
+    return out
+
+def backtest_dca_grid(csv_path,
+                      base_order_usdt=10.0,
+                      safety_orders=12,
+                      step_pct=0.015,
+                      volume_scale=1.4,
+                      tp_pct=0.008,
+                      max_position_usdt=500.0,
+                      start_equity=1000.0,
+                      plot_path=None,
+                      trades_csv=None,
+                      summary_json=None,
+                      equity_stride=1):
+    times, closes = _load_prices(csv_path)
+
+    # Without numba the kernel is interpreted, and indexing a list of native
+    # floats is several times cheaper than boxing a NumPy scalar per bar.
+    prices = closes if _HAVE_NUMBA else closes.tolist()
+    (equity_out, trade_pnl, trade_levels, trade_exit_idx, trade_avg, ntrades,
+     deepest_level, largest_pos_usdt) = _make_kernel(int(safety_orders))(
+        prices, float(base_order_usdt), float(step_pct), float(volume_scale),
+        float(tp_pct), float(max_position_usdt), float(start_equity))
+
+    if equity_stride > 1 and len(equity_out):
+        # keep the last bar of every equity_stride bars (and the final bar);
+        # summary stats below still use the full-resolution series
+        idx = np.arange(equity_stride - 1, len(equity_out), equity_stride)
+        if not idx.size or idx[-1] != len(equity_out) - 1:
+            idx = np.append(idx, len(equity_out) - 1)
+        eq = pd.DataFrame({'time': times[idx], 'equity': equity_out[idx]}, copy=False)
+    else:
+        eq = pd.DataFrame({'time': times, 'equity': equity_out}, copy=False)
+    # drawdown only depends on the equity series, so compute it in one pass
+    peak = np.maximum.accumulate(equity_out)
+    max_dd = float((equity_out - peak).min()) if len(equity_out) else 0.0
+    exit_idx = trade_exit_idx[:ntrades]
+    trades = pd.DataFrame({'time_close': times[exit_idx], 'pnl': trade_pnl[:ntrades],
+                           'levels': trade_levels[:ntrades], 'avg_entry': trade_avg[:ntrades],
+                           'exit_price': closes[exit_idx].astype(np.float64)}, copy=False)
+    pnl = trade_pnl[:ntrades]
     summary = {
-        'bars': len(df),
-        'trades_closed': len(trades),
-        'total_pnl': float(np.sum([t['pnl'] for t in trades])),
-        'win_rate': float(np.mean([1.0 if t['pnl']>0 else 0.0 for t in trades])) if trades else float('nan'),
+        'bars': len(closes),
+        'trades_closed': int(ntrades),
+        'total_pnl': float(pnl.sum()),
+        'win_rate': float((pnl > 0).mean()) if ntrades else float('nan'),
         'max_drawdown_abs': float(max_dd),
         'max_drawdown_pct': float(max_dd / start_equity * 100.0),
         'deepest_level_hit': int(deepest_level),
@@ -115,14 +256,15 @@ def backtest_dca_grid(csv_path,
 
     if plot_path:
         import matplotlib.pyplot as plt
-        plt.figure(figsize=(10,4))
+        fig = plt.figure(figsize=(10,4))
         plt.plot(eq['time'], eq['equity'])
         plt.title("Equity Curve - DOGEUSDT 1H - DCA Grid (No SL)")
         plt.xlabel("Time"); plt.ylabel("Equity (USDT)")
         plt.tight_layout(); plt.savefig(plot_path)
+        plt.close(fig)
 
     if trades_csv:
-        pd.DataFrame(trades).to_csv(trades_csv, index=False)
+        trades.to_csv(trades_csv, index=False)
 
     if summary_json:
         import json
@@ -12,6 +12,8 @@ Aggressive preset sized for ~600 USDT equity
 - DCA against adverse moves with limits; widen step when deep (>= level 3 add +3%).
 - Funding guard for SHORT: pause SHORT open/DCA if funding < -0.06%/8h.
 - Throttled logs: Heartbeat every 30s, RiskView every 120s (configurable via ENV).
+- Ticker and position are pushed by WebSocket (public tickers, private position);
+  REST polls price only while the stream is silent and reconciles position every 30s.
 
 ENV: BYBIT_API_KEY/BYBIT_API_SECRET (or API_KEY/API_SECRET)
 LOG_LEVEL (optional): INFO|WARNING (default INFO)
@@ -19,19 +21,36 @@ LOG_HEARTBEAT_SEC, LOG_RISKVIEW_SEC (optional)
 Needs: pip install pybit
 """
 
-import os, time, math, uuid, logging
+import os, time, uuid, itertools, threading, logging, asyncio, queue, atexit
+from logging.handlers import QueueHandler, QueueListener
 from dataclasses import dataclass, field
 from typing import Optional, Callable, Any, Tuple, List
-from pybit.unified_trading import HTTP
+from pybit.unified_trading import HTTP, WebSocket
+from requests.adapters import HTTPAdapter
+try:
+    import numpy as np
+except ImportError:  # optional: only speeds up the RSI seed
+    np = None
 
 # -------- logging setup (honor LOG_LEVEL env if set) --------
+# records are queued and formatted/written to stderr by a listener thread, so
+# the trading loop only pays for a queue put
+class _RawQueueHandler(QueueHandler):
+    def prepare(self, record):
+        return record   # same-process queue: leave formatting to the listener thread
+
 _level = os.environ.get("LOG_LEVEL", "INFO").upper()
-logging.basicConfig(level=getattr(logging, _level, logging.INFO),
-                    format="%(asctime)s %(levelname)s: %(message)s")
+_log_q = queue.SimpleQueue()
+logging.basicConfig(level=getattr(logging, _level, logging.INFO), handlers=[_RawQueueHandler(_log_q)])
+_log_out = logging.StreamHandler()
+_log_out.setFormatter(logging.Formatter("%(asctime)s %(levelname)s: %(message)s"))
+_log_listener = QueueListener(_log_q, _log_out)
+_log_listener.start()
+atexit.register(_log_listener.stop)
 
 # ---------------------- config (Aggressive for ~600 USDT) ----------------------
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class LongCfg:
     base_usdt: float = 40.0
     step_pct: float = 0.055          # 5.5%
@@ -40,7 +59,7 @@ class LongCfg:
     tp_pct_floor: float = 0.01       # 1% min raw TP
     max_position_usdt: float = 500.0 # cap ~500
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class ShortCfg:
     base_usdt: float = 12.0
     step_pct: float = 0.075          # 7.5%
@@ -49,7 +68,7 @@ class ShortCfg:
     tp_pct_floor: float = 0.01       # 1%
     max_position_usdt: float = 120.0 # cap ~120
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class RiskCfg:
     leverage: float = 2.0
     taker_fee: float = 0.0006
@@ -59,7 +78,7 @@ class RiskCfg:
     widen_step_level: int = 3        # widen when DCA level >= 3
     widen_step_add: float = 0.03     # add +3% to step when deep
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class GuardCfg:
     cooldown_seconds: int = 600      # 10 minutes
     rsi_period: int = 14
@@ -67,21 +86,23 @@ class GuardCfg:
     short_funding_pause: float = -0.0006  # pause SHORT if funding < -0.06%/8h
     prefer_short_rsi: float = 70.0        # RSI_D > 70 => prefer SHORT
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class TPModeCfg:
     tp_order_mode: str = "limit_postonly"  # default: maker; alt: "market_conditional"
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class LogCfg:
     heartbeat_sec: int = int(os.environ.get("LOG_HEARTBEAT_SEC", "30"))  # status every 30s
     riskview_sec: int = int(os.environ.get("LOG_RISKVIEW_SEC", "120"))   # liq/adl every 120s
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Config:
     symbol: str = "DOGEUSDT"
     category: str = "linear"
     poll_sec: float = 3.0
     recv_window: int = 60000
+    keepalive_sec: float = 60.0      # ping REST before Bybit drops the idle socket (~90s)
+    reconcile_sec: float = 30.0      # REST position check behind the private stream
     long: LongCfg = field(default_factory=LongCfg)
     short: ShortCfg = field(default_factory=ShortCfg)
     risk: RiskCfg = field(default_factory=RiskCfg)
@@ -91,33 +112,82 @@ class Config:
 
 # ---------------------- utils ----------------------
 
-def with_retry(fn: Callable[..., Any], *args, **kwargs):
-    tries = kwargs.pop("_tries", 5)
+_BACKOFF = (1.2, 2.4, 4.8, 9.6, 19.2)   # 1.2 * 2**attempt
+
+def with_retry(fn: Callable[..., Any], *args, _tries: int = 5, **kwargs):
+    # fast path: one plain call; the retry machinery only runs after a failure
+    try:
+        return fn(*args, **kwargs)
+    except Exception as e:
+        return _retry_slow(fn, args, kwargs, _tries, e)
+
+def _retry_slow(fn: Callable[..., Any], args: tuple, kwargs: dict, tries: int, err: Exception):
     for i in range(tries):
-        try:
-            return fn(*args, **kwargs)
-        except Exception as e:
-            wait = 1.2 * (2 ** i)
-            logging.warning("API call failed (attempt %d/%d): %s; retrying in %.1fs", i+1, tries, e, wait)
-            time.sleep(wait)
+        if i:  # attempt 1 already failed in with_retry
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                err = e
+        wait = _BACKOFF[min(i, len(_BACKOFF) - 1)]
+        logging.warning("API call failed (attempt %d/%d): %s; retrying in %.1fs", i+1, tries, err, wait)
+        time.sleep(wait)
     return fn(*args, **kwargs)
 
-def calc_rsi_from_closes(closes: List[float], period: int) -> Optional[float]:
+def wilder_step(avg_gain: float, avg_loss: float, diff: float, period: int) -> Tuple[float, float]:
+    n1 = period - 1
+    return (avg_gain * n1 + max(diff, 0.0)) / period, (avg_loss * n1 + max(-diff, 0.0)) / period
+
+def wilder_avgs(closes: List[float], period: int) -> Optional[Tuple[float, float]]:
+    # closes oldest first; seed with the simple mean of the first `period` moves, then smooth
     if len(closes) < period + 1:
         return None
-    gains = []; losses = []
+    if np is not None:
+        diff = np.diff(np.asarray(closes, dtype=np.float64))
+        gain = np.maximum(diff, 0.0); loss = np.maximum(-diff, 0.0)
+        # the Wilder recurrence unrolled: decay the seed, weight later moves by beta**age
+        beta = (period - 1) / period
+        w = beta ** np.arange(len(diff) - period - 1, -1, -1) / period
+        decay = beta ** (len(diff) - period)
+        avg_gain = decay * gain[:period].mean() + float(w @ gain[period:])
+        avg_loss = decay * loss[:period].mean() + float(w @ loss[period:])
+        return float(avg_gain), float(avg_loss)
+    gain_sum = loss_sum = 0.0
     for i in range(1, period+1):
-        diff = closes[-i] - closes[-i-1]
-        gains.append(max(diff, 0.0)); losses.append(max(-diff, 0.0))
-    avg_gain = sum(gains) / period
-    avg_loss = sum(losses) / period
+        diff = closes[i] - closes[i-1]
+        if diff > 0: gain_sum += diff
+        else: loss_sum -= diff
+    avg_gain = gain_sum / period
+    avg_loss = loss_sum / period
+    for i in range(period+1, len(closes)):
+        avg_gain, avg_loss = wilder_step(avg_gain, avg_loss, closes[i] - closes[i-1], period)
+    return avg_gain, avg_loss
+
+def rsi_from_avgs(avg_gain: float, avg_loss: float) -> float:
     if avg_loss == 0: return 100.0
     rs = avg_gain / avg_loss
     return 100.0 - (100.0 / (1.0 + rs))
 
+def calc_rsi_from_closes(closes: List[float], period: int) -> Optional[float]:
+    avgs = wilder_avgs(closes, period)
+    return rsi_from_avgs(*avgs) if avgs is not None else None
+
 # ---------------------- bot ----------------------
 
 class DogeFlipAggressiveWinOnly:
+    # every attribute the bot ever sets; keep in sync when adding state
+    __slots__ = (
+        "http", "cfg",
+        "side", "cooldown_until", "pos_qty", "avg_entry", "level", "size_usdt", "next_price",
+        "tp_order_id", "entry_fees_paid_usd", "_entry_notional", "_side_sign",
+        "_side_cfg", "_step_sign", "_side_order_fn", "_side_tag", "_tp_fee_div", "_tp_floor_mult",
+        "_link_prefix", "_link_seq", "_tp_target_cache", "_dyn_step_cache", "_pending_ops", "_tp_pending", "_entry_undo",
+        "_t_last_hb", "_t_last_risk", "_t_last_rest", "_t_last_funding_warn",
+        "_px", "_pos_pending", "_pos_seq", "_t_last_tick", "_aloop", "_wake", "_rest_pos", "_orders_sent",
+        "qty_step", "min_qty", "tick_size", "_inv_qty_step", "_inv_tick",
+        "_rsi_lock", "_rsi_ts", "_rsi_daily", "_rsi_avg_gain", "_rsi_avg_loss", "_rsi_last_close", "_rsi_last_bar_ts",
+        "_funding_rate",
+    )
+
     def __init__(self, http: HTTP, cfg: Config):
         self.http = http; self.cfg = cfg
 
@@ -131,10 +201,35 @@ class DogeFlipAggressiveWinOnly:
         self.next_price: Optional[float] = None
         self.tp_order_id: Optional[str] = None
         self.entry_fees_paid_usd = 0.0
+        self._entry_notional = 0.0          # sum(qty * fill price) == avg_entry * pos_qty
+        self._bind_side()
+        # orderLinkId = random per-process prefix + counter (no urandom per order)
+        self._link_prefix = uuid.uuid4().hex[:8]; self._link_seq = itertools.count(1)
+        # derived from the position; cleared by _invalidate_targets whenever it changes
+        self._tp_target_cache: Optional[float] = None
+        self._dyn_step_cache: Optional[float] = None
+        # orders queued during one step, sent together by _flush_ops
+        self._pending_ops: List[dict] = []
+        self._tp_pending: Optional[tuple] = None   # (link, log fmt, price, qty) of a queued TP
+        self._entry_undo: Optional[tuple] = None   # position bookkeeping before the queued entry
 
         # log throttling timers
         self._t_last_hb = 0.0
         self._t_last_risk = 0.0
+        self._t_last_rest = 0.0
+        self._t_last_funding_warn = 0.0
+
+        # stream state; pybit calls back on its own threads, _wake hands work to the loop
+        self._px: Optional[Tuple[float, float]] = None   # (last, mark)
+        self._pos_pending: Optional[list] = None
+        self._pos_seq = -1
+        # REST position snapshot, tagged with the order count at fetch time; dropped if an
+        # order went out meanwhile (the snapshot may predate its fill) or a push is waiting
+        self._rest_pos: Optional[tuple] = None
+        self._orders_sent = 0
+        self._t_last_tick = 0.0
+        self._aloop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
 
         # instrument
         info = with_retry(self.http.get_instruments_info, category=cfg.category, symbol=cfg.symbol)
@@ -142,6 +237,7 @@ class DogeFlipAggressiveWinOnly:
         lot = inst["lotSizeFilter"]; pricef = inst["priceFilter"]
         self.qty_step = float(lot["qtyStep"]); self.min_qty = float(lot["minOrderQty"])
         self.tick_size = float(pricef["tickSize"])
+        self._inv_qty_step = 1.0 / self.qty_step; self._inv_tick = 1.0 / self.tick_size
 
         # one-way & leverage (no retry spam; "not modified" -> INFO)
         try:
@@ -165,56 +261,124 @@ class DogeFlipAggressiveWinOnly:
             else:
                 logging.warning("Cannot set leverage: %s", e)
 
-        # RSI cache
+        # RSI cache; funding comes with the ticker that last_mark already fetched
         self._rsi_ts = 0.0; self._rsi_daily = None
+        self._rsi_lock = threading.Lock()   # refreshed from the watchdog and the step threads
+        # Wilder state over closed daily bars only; the forming bar is applied on top
+        self._rsi_avg_gain: Optional[float] = None; self._rsi_avg_loss: Optional[float] = None
+        self._rsi_last_close: Optional[float] = None; self._rsi_last_bar_ts = 0
+        self._funding_rate: Optional[float] = None
 
     # helpers
     def round_qty(self, q: float) -> float:
-        q = math.floor(q / self.qty_step) * self.qty_step
-        if q > 0 and q < self.min_qty: q = self.min_qty
-        return q
+        # +1e-9 step so exact multiples (0.101 * 1e5 = 10099.999...) don't lose a step
+        q = int(q * self._inv_qty_step + 1e-9) * self.qty_step
+        return self.min_qty if 0 < q < self.min_qty else q
+
+    def _link(self) -> str:
+        return f"{self._link_prefix}-{next(self._link_seq)}"
 
     def round_px(self, px: float) -> float:
-        return math.floor(px / self.tick_size) * self.tick_size
+        return int(px * self._inv_tick + 1e-9) * self.tick_size
 
-    def last_mark(self) -> Tuple[float, float]:
+    def _fetch_ticker_snapshot(self) -> Tuple[float, float, Optional[float]]:
+        # one get_tickers serves price, mark and funding
         r = with_retry(self.http.get_tickers, category=self.cfg.category, symbol=self.cfg.symbol)
         item = r["result"]["list"][0]
         last = float(item["lastPrice"]); mark = float(item.get("markPrice", last))
+        fr = item.get("fundingRate")
+        try:
+            self._funding_rate = float(fr) if fr is not None else None
+        except Exception:
+            self._funding_rate = None
+        self._t_last_rest = time.monotonic()
+        return last, mark, self._funding_rate
+
+    def last_mark(self) -> Tuple[float, float]:
+        last, mark, _ = self._fetch_ticker_snapshot()
         return last, mark
 
+    def keepalive(self):
+        # cheap public call so the pooled TLS connection is reused, not re-handshaked
+        if time.monotonic() - self._t_last_rest < self.cfg.keepalive_sec: return
+        try:
+            self.http.get_server_time()
+        except Exception as e:
+            logging.debug("Keep-alive ping failed: %s", e)
+        self._t_last_rest = time.monotonic()
+
+    def _rsi_due(self) -> bool:
+        return self._rsi_daily is None or time.monotonic() - self._rsi_ts >= self.cfg.guard.rsi_refresh_sec
+
     def get_daily_rsi(self) -> Optional[float]:
-        now = time.time()
-        if now - self._rsi_ts < self.cfg.guard.rsi_refresh_sec and self._rsi_daily is not None:
+        if not self._rsi_due():
             return self._rsi_daily
+        with self._rsi_lock:
+            if not self._rsi_due():   # the other thread refreshed it while we waited
+                return self._rsi_daily
+            return self._refresh_rsi()
+
+    def _refresh_rsi(self) -> Optional[float]:
+        now = time.monotonic()
         try:
-            r = with_retry(self.http.get_kline, category="linear", symbol=self.cfg.symbol, interval="D", limit=120)
-            lst = sorted(r["result"]["list"], key=lambda x: int(x[0]))
-            closes = [float(x[4]) for x in lst]
-            rsi_d = calc_rsi_from_closes(closes, self.cfg.guard.rsi_period)
+            period = self.cfg.guard.rsi_period
+            # Bybit returns klines newest first: [0] is today's forming bar, [1] the last closed one
+            lst = self._daily_klines(2 if self._rsi_avg_gain is not None else 120)
+            bar_ts = int(lst[1][0])   # last closed bar; parsed once, no sort needed
+            if self._rsi_avg_gain is not None and bar_ts - self._rsi_last_bar_ts > 86_400_000:
+                lst = self._daily_klines(120)   # missed a whole bar (refreshes failing): reseed
+                bar_ts = int(lst[1][0]); self._rsi_avg_gain = None
+            if self._rsi_avg_gain is None:
+                closed = [float(x[4]) for x in reversed(lst[1:])]
+                avgs = wilder_avgs(closed, period)
+                if avgs is None:
+                    return None
+                self._rsi_avg_gain, self._rsi_avg_loss = avgs
+                self._rsi_last_close = closed[-1]; self._rsi_last_bar_ts = bar_ts
+            elif bar_ts > self._rsi_last_bar_ts:
+                close = float(lst[1][4])
+                self._rsi_avg_gain, self._rsi_avg_loss = wilder_step(
+                    self._rsi_avg_gain, self._rsi_avg_loss, close - self._rsi_last_close, period)
+                self._rsi_last_close = close; self._rsi_last_bar_ts = bar_ts
+            rsi_d = rsi_from_avgs(*wilder_step(self._rsi_avg_gain, self._rsi_avg_loss,
+                                               float(lst[0][4]) - self._rsi_last_close, period))
             self._rsi_daily = rsi_d; self._rsi_ts = now
             return rsi_d
         except Exception as e:
             logging.warning("RSI fetch failed: %s", e)
             return None
 
+    def _daily_klines(self, limit: int) -> list:
+        r = with_retry(self.http.get_kline, category="linear", symbol=self.cfg.symbol, interval="D", limit=limit)
+        return r["result"]["list"]
+
     def fetch_funding_rate(self) -> Optional[float]:
+        # kept fresh by every ticker push / REST price fetch
+        if self._funding_rate is not None:
+            return self._funding_rate
         try:
-            r = with_retry(self.http.get_tickers, category=self.cfg.category, symbol=self.cfg.symbol)
-            item = r["result"]["list"][0]
-        except Exception:
-            return None
-        fr = item.get("fundingRate")
-        try:
-            return float(fr) if fr is not None else None
+            return self._fetch_ticker_snapshot()[2]
         except Exception:
             return None
 
     # sync live position (maker TP detection) + get liq/adl
-    def sync_position(self):
+    def fetch_positions(self) -> dict:
+        return with_retry(self.http.get_positions, category=self.cfg.category, symbol=self.cfg.symbol)
+
+    def _position_poll_needed(self) -> bool:
+        # REST position polls exist to catch maker TP fills; flat in cooldown with no TP, nothing can fill
+        return not (self.pos_qty == 0.0 and self.tp_order_id is None and time.monotonic() < self.cooldown_until)
+
+    def sync_position(self, lst: Optional[list] = None, detect_tp: bool = True):
         try:
-            r = with_retry(self.http.get_positions, category=self.cfg.category, symbol=self.cfg.symbol)
-            lst = r.get("result", {}).get("list", [])
+            if lst is None:
+                if not self._position_poll_needed(): return
+                lst = self.fetch_positions().get("result", {}).get("list", [])
+            # REST reconcile and stream pushes can cross; never apply an older snapshot
+            seq = max((int(p.get("seq") or -1) for p in lst), default=-1)
+            if 0 <= seq < self._pos_seq:
+                return
+            self._pos_seq = max(self._pos_seq, seq)
             size = 0.0; avg = None; liq = None; adl = None
             for p in lst:
                 sz = float(p.get("size") or 0.0)
@@ -230,15 +394,20 @@ class DogeFlipAggressiveWinOnly:
                     break
             # detect TP fill
             if size == 0.0 and self.pos_qty > 0.0:
+                if not detect_tp:
+                    self._reset_position_state(); return   # adopt flat, no cooldown/flip
                 logging.info("Detected position closed on exchange (likely TP filled).")
                 self._on_tp_filled_flip()
             else:
                 # refresh local state
-                self.pos_qty = size
-                self.avg_entry = avg if size > 0 else None
+                avg = avg if size > 0 else None
+                if size != self.pos_qty or avg != self.avg_entry:
+                    self.pos_qty = size; self.avg_entry = avg
+                    self._entry_notional = size * avg if avg is not None else 0.0
+                    self._invalidate_targets()
                 # throttled risk view
                 if size > 0:
-                    now = time.time()
+                    now = time.monotonic()
                     if now - self._t_last_risk >= self.cfg.log.riskview_sec:
                         logging.info("RiskView liqPrice=%s adlRank=%s",
                                      f"{liq:.6f}" if liq is not None else "NA", str(adl))
@@ -247,37 +416,36 @@ class DogeFlipAggressiveWinOnly:
             logging.warning("sync_position failed: %s", e)
 
     # fees & pnl
-    def _add_entry_fee(self, notional: float):
+    def _add_entry(self, notional: float):
+        self._entry_notional += notional
         self.entry_fees_paid_usd += notional * self.cfg.risk.taker_fee
 
     def expected_net_pnl(self, exit_price: float) -> float:
         if self.pos_qty <= 0 or self.avg_entry is None: return 0.0
-        if self.side == "long":
-            gross = (exit_price - self.avg_entry) * self.pos_qty
-        else:
-            gross = (self.avg_entry - exit_price) * self.pos_qty
-        exit_fee = exit_price * self.pos_qty * self.cfg.risk.taker_fee
-        return gross - self.entry_fees_paid_usd - exit_fee
+        exit_notional = exit_price * self.pos_qty
+        return (self._side_sign * (exit_notional - self._entry_notional)
+                - self.entry_fees_paid_usd - exit_notional * self.cfg.risk.taker_fee)
+
+    def _invalidate_targets(self):
+        self._tp_target_cache = None; self._dyn_step_cache = None
 
     def dynamic_step(self) -> float:
+        if self._dyn_step_cache is not None: return self._dyn_step_cache
         add = self.cfg.risk.widen_step_add if self.level >= self.cfg.risk.widen_step_level else 0.0
         base = self.cfg.long.step_pct if self.side == "long" else self.cfg.short.step_pct
-        return base + add
+        self._dyn_step_cache = base + add
+        return self._dyn_step_cache
 
     def calc_tp_target_win_only(self) -> Optional[float]:
+        if self._tp_target_cache is not None: return self._tp_target_cache
         if self.pos_qty <= 0 or self.avg_entry is None: return None
-        qty = self.pos_qty; fee = self.cfg.risk.taker_fee; minp = self.cfg.risk.min_profit_usd
-        if self.side == "long":
-            rhs = (self.entry_fees_paid_usd + minp) / max(qty, 1e-9)
-            P = (self.avg_entry + rhs) / (1.0 - fee)
-            P_floor = self.avg_entry * (1.0 + self.cfg.long.tp_pct_floor)
-            target = max(P, P_floor)
-        else:
-            rhs = (self.entry_fees_paid_usd + minp) / max(qty, 1e-9)
-            P = (self.avg_entry - rhs) / (1.0 + fee)
-            P_floor = self.avg_entry * (1.0 - self.cfg.short.tp_pct_floor)
-            target = min(P, P_floor)
-        return self.round_px(target)
+        # long: max(P, floor) above entry; short: min(P, floor) below it (sign = -1 / +1)
+        rhs = (self.entry_fees_paid_usd + self.cfg.risk.min_profit_usd) / max(self.pos_qty, 1e-9)
+        P = (self.avg_entry - self._step_sign * rhs) / self._tp_fee_div
+        P_floor = self.avg_entry * self._tp_floor_mult
+        target = P if (P - P_floor) * self._step_sign <= 0 else P_floor
+        self._tp_target_cache = self.round_px(target)
+        return self._tp_target_cache
 
     # TP orders
     def cancel_tp(self):
@@ -295,46 +463,98 @@ class DogeFlipAggressiveWinOnly:
         if trg is None or self.pos_qty <= 0: return
         qty = self.round_qty(self.pos_qty)
         self.cancel_tp()
-        link = str(uuid.uuid4())
+        link = self._link()
+        side = "Sell" if self.side == "long" else "Buy"
         if self.cfg.tp_mode.tp_order_mode == "limit_postonly":
-            side = "Sell" if self.side == "long" else "Buy"
-            order = with_retry(self.http.place_order,
-                               category=self.cfg.category, symbol=self.cfg.symbol,
-                               side=side, orderType="Limit", qty=str(qty),
+            self._enqueue(dict(side=side, orderType="Limit", qty=str(qty),
                                price=str(trg), reduceOnly=True, timeInForce="PostOnly",
-                               closeOnTrigger=False, orderLinkId=link)
-            self.tp_order_id = order.get("result", {}).get("orderId")
-            logging.info("TP (maker) %s: price=%.6f qty=%s id=%s", self.side, trg, qty, self.tp_order_id)
+                               closeOnTrigger=False, orderLinkId=link))
+            self._tp_pending = (link, "TP (maker) %s: price=%.6f qty=%s id=%s", trg, qty)
         else:
-            side = "Sell" if self.side == "long" else "Buy"
             trig_dir = 1 if self.side == "long" else 2
-            order = with_retry(self.http.place_order,
-                               category=self.cfg.category, symbol=self.cfg.symbol,
-                               side=side, orderType="Market", qty=str(qty),
+            self._enqueue(dict(side=side, orderType="Market", qty=str(qty),
                                triggerDirection=trig_dir, triggerPrice=str(trg),
-                               reduceOnly=True, closeOnTrigger=True, orderLinkId=link)
-            self.tp_order_id = order.get("result", {}).get("orderId")
-            logging.info("TP (conditional) %s: trigger=%.6f qty=%s id=%s", self.side, trg, qty, self.tp_order_id)
+                               reduceOnly=True, closeOnTrigger=True, orderLinkId=link))
+            self._tp_pending = (link, "TP (conditional) %s: trigger=%.6f qty=%s id=%s", trg, qty)
+
+    # order ops: entries and their TP are queued, then sent as one place_batch_order
+    def _enqueue(self, order: dict):
+        order["symbol"] = self.cfg.symbol
+        self._pending_ops.append(order)
+
+    def _flush_ops(self):
+        if not self._pending_ops: return
+        ops, self._pending_ops = self._pending_ops, []
+        tp, self._tp_pending = self._tp_pending, None
+        self._orders_sent += 1
+        try:
+            r = with_retry(self.http.place_batch_order, category=self.cfg.category, request=ops)
+        except Exception as e:
+            # outcome unknown after the retries: handled as a rejection below, the REST sync adopts whatever filled
+            logging.warning("Batch order failed: %s", e)
+            r = {}
+        results = r.get("result", {}).get("list", [])
+        codes = r.get("retExtInfo", {}).get("list", [])
+        ids = {}
+        for i, res in enumerate(results):
+            code = codes[i].get("code", 0) if i < len(codes) else 0
+            if code == 0 and res.get("orderId"):
+                ids[res.get("orderLinkId")] = res["orderId"]
+        undo, self._entry_undo = self._entry_undo, None
+        tp_link = tp[0] if tp is not None else None
+        rejected = [op["orderLinkId"] for op in ops if op["orderLinkId"] not in ids and op["orderLinkId"] != tp_link]
+        if rejected:
+            # the entry never happened: its TP is sized for a position that doesn't exist
+            logging.warning("Entry %s rejected: %s", rejected, codes or "no reply")
+            if tp_link in ids:
+                try:
+                    with_retry(self.http.cancel_order, category=self.cfg.category, symbol=self.cfg.symbol,
+                               orderId=ids[tp_link])
+                except Exception as e:
+                    logging.warning("Cancel TP of rejected entry failed: %s", e)
+            if undo is not None:
+                (self.pos_qty, self.avg_entry, self.level, self.size_usdt, self.next_price,
+                 self.entry_fees_paid_usd, self._entry_notional) = undo
+                self._invalidate_targets()
+            self.tp_order_id = None   # place_tp already cancelled the previous one
+            self.sync_position(detect_tp=False)   # take the exchange's size, never as a TP fill
+            if self.pos_qty > 0:
+                self.place_tp(); self._flush_ops()   # re-arm TP for the position we still hold
+            return
+        if tp is not None:
+            if tp_link not in ids:
+                # reduce-only TP can be refused if the entry had not filled yet: place it alone
+                try:
+                    self._orders_sent += 1
+                    order = with_retry(self.http.place_order, category=self.cfg.category,
+                                       **next(op for op in ops if op["orderLinkId"] == tp_link))
+                    ids[tp_link] = order.get("result", {}).get("orderId")
+                except Exception as e:
+                    logging.warning("TP %s rejected: %s", tp_link, e)
+            self.tp_order_id = ids.get(tp_link)
+            logging.info(tp[1], self.side, tp[2], tp[3], self.tp_order_id)
+
+    def _save_entry_undo(self):
+        if self._entry_undo is None:
+            self._entry_undo = (self.pos_qty, self.avg_entry, self.level, self.size_usdt, self.next_price,
+                                self.entry_fees_paid_usd, self._entry_notional)
 
-    # order ops
     def mkt_buy(self, qty: float, price: float):
         qty = self.round_qty(qty); 
         if qty <= 0: return
         notional = qty * price
-        link = str(uuid.uuid4())
-        with_retry(self.http.place_order, category=self.cfg.category, symbol=self.cfg.symbol,
-                   side="Buy", orderType="Market", qty=str(qty), reduceOnly=False, orderLinkId=link)
-        self.pos_qty += qty; self._add_entry_fee(notional)
+        link = self._link(); self._save_entry_undo()
+        self._enqueue(dict(side="Buy", orderType="Market", qty=str(qty), reduceOnly=False, orderLinkId=link))
+        self.pos_qty += qty; self._add_entry(notional); self._invalidate_targets()
         logging.info("BUY qty=%s link=%s", qty, link)
 
     def mkt_sell(self, qty: float, price: float):
         qty = self.round_qty(qty); 
         if qty <= 0: return
         notional = qty * price
-        link = str(uuid.uuid4())
-        with_retry(self.http.place_order, category=self.cfg.category, symbol=self.cfg.symbol,
-                   side="Sell", orderType="Market", qty=str(qty), reduceOnly=False, orderLinkId=link)
-        self.pos_qty += qty; self._add_entry_fee(notional)
+        link = self._link(); self._save_entry_undo()
+        self._enqueue(dict(side="Sell", orderType="Market", qty=str(qty), reduceOnly=False, orderLinkId=link))
+        self.pos_qty += qty; self._add_entry(notional); self._invalidate_targets()
         logging.info("SELL qty=%s link=%s", qty, link)
 
     def _on_tp_filled_flip(self):
@@ -347,7 +567,7 @@ class DogeFlipAggressiveWinOnly:
         if self.pos_qty <= 0: return
         if self.cfg.risk.close_requires_net_profit and self.expected_net_pnl(price) < self.cfg.risk.min_profit_usd:
             logging.info("Skip close LONG — net pnl not positive yet."); return
-        qty = self.round_qty(self.pos_qty); link = str(uuid.uuid4())
+        qty = self.round_qty(self.pos_qty); link = self._link(); self._orders_sent += 1
         with_retry(self.http.place_order, category=self.cfg.category, symbol=self.cfg.symbol,
                    side="Sell", orderType="Market", qty=str(qty), reduceOnly=True, orderLinkId=link)
         logging.info("CLOSE LONG qty=%s link=%s", qty, link)
@@ -357,7 +577,7 @@ class DogeFlipAggressiveWinOnly:
         if self.pos_qty <= 0: return
         if self.cfg.risk.close_requires_net_profit and self.expected_net_pnl(price) < self.cfg.risk.min_profit_usd:
             logging.info("Skip close SHORT — net pnl not positive yet."); return
-        qty = self.round_qty(self.pos_qty); link = str(uuid.uuid4())
+        qty = self.round_qty(self.pos_qty); link = self._link(); self._orders_sent += 1
         with_retry(self.http.place_order, category=self.cfg.category, symbol=self.cfg.symbol,
                    side="Buy", orderType="Market", qty=str(qty), reduceOnly=True, orderLinkId=link)
         logging.info("CLOSE SHORT qty=%s link=%s", qty, link)
@@ -366,6 +586,8 @@ class DogeFlipAggressiveWinOnly:
     def _reset_position_state(self):
         self.pos_qty = 0.0; self.avg_entry = None; self.level = -1
         self.size_usdt = 0.0; self.next_price = None; self.entry_fees_paid_usd = 0.0
+        self._entry_notional = 0.0
+        self._invalidate_targets()
         self.cancel_tp()
 
     # core: open/DCA and TP+flip
@@ -374,54 +596,37 @@ class DogeFlipAggressiveWinOnly:
         if self.side == "short":
             fr = self.fetch_funding_rate()
             if fr is not None and fr < self.cfg.guard.short_funding_pause:
-                logging.warning("Funding too negative (%.5f). Pause opening/DCA SHORT.", fr)
+                now = time.monotonic()
+                if now - self._t_last_funding_warn >= self.cfg.poll_sec:   # pushes arrive far faster
+                    logging.warning("Funding too negative (%.5f). Pause opening/DCA SHORT.", fr)
+                    self._t_last_funding_warn = now
                 return
 
-        dyn_step = self.dynamic_step()
-        if self.side == "long":
-            if self.pos_qty == 0:
-                if self._notional(price) > self.cfg.long.max_position_usdt:
-                    logging.warning("Base long exceeds cap; skip"); return
-                qty = self.cfg.long.base_usdt / price
-                self.mkt_buy(qty, price)
-                self.avg_entry = price; self.level = 0; self.size_usdt = self.cfg.long.base_usdt
-                self.next_price = price * (1 - dyn_step)
-                self.place_tp()
-                logging.info("Open LONG avg=%.6f next=%.6f", self.avg_entry, self.next_price); return
-            if self.level < self.cfg.long.max_dca and price <= self.next_price:
-                next_usdt = self.size_usdt * self.cfg.long.volume_scale
-                if self._notional(price) + next_usdt <= self.cfg.long.max_position_usdt + 1e-9:
-                    prev_qty = self.pos_qty
-                    self.mkt_buy(next_usdt / price, price)
-                    filled = max(0.0, self.pos_qty - prev_qty)
-                    if filled > 0:
-                        self.avg_entry = ((self.avg_entry * prev_qty) + price * filled) / self.pos_qty
-                        self.level += 1; self.size_usdt = next_usdt
-                        self.next_price = price * (1 - self.dynamic_step())
-                        self.place_tp()
-                        logging.info("DCA LONG L%d avg=%.6f next=%.6f", self.level, self.avg_entry, self.next_price)
-        else:
-            if self.pos_qty == 0:
-                if self._notional(price) > self.cfg.short.max_position_usdt:
-                    logging.warning("Base short exceeds cap; skip"); return
-                qty = self.cfg.short.base_usdt / price
-                self.mkt_sell(qty, price)
-                self.avg_entry = price; self.level = 0; self.size_usdt = self.cfg.short.base_usdt
-                self.next_price = price * (1 + dyn_step)
-                self.place_tp()
-                logging.info("Open SHORT avg=%.6f next=%.6f", self.avg_entry, self.next_price); return
-            if self.level < self.cfg.short.max_dca and price >= self.next_price:
-                next_usdt = self.size_usdt * self.cfg.short.volume_scale
-                if self._notional(price) + next_usdt <= self.cfg.short.max_position_usdt + 1e-9:
-                    prev_qty = self.pos_qty
-                    self.mkt_sell(next_usdt / price, price)
-                    filled = max(0.0, self.pos_qty - prev_qty)
-                    if filled > 0:
-                        self.avg_entry = ((self.avg_entry * prev_qty) + price * filled) / self.pos_qty
-                        self.level += 1; self.size_usdt = next_usdt
-                        self.next_price = price * (1 + self.dynamic_step())
-                        self.place_tp()
-                        logging.info("DCA SHORT L%d avg=%.6f next=%.6f", self.level, self.avg_entry, self.next_price)
+        # one body for both sides; the per-side bits are bound by _bind_side on flip
+        sc = self._side_cfg; sign = self._step_sign
+        if self.pos_qty == 0:
+            if self._notional(price) > sc.max_position_usdt:
+                logging.warning("Base %s exceeds cap; skip", self.side); return
+            dyn_step = self.dynamic_step()
+            self._side_order_fn(sc.base_usdt / price, price)
+            self.avg_entry = price; self.level = 0; self.size_usdt = sc.base_usdt
+            self._invalidate_targets()
+            self.next_price = price * (1 + sign * dyn_step)
+            self.place_tp()
+            logging.info("Open %s avg=%.6f next=%.6f", self._side_tag, self.avg_entry, self.next_price); return
+        if self.level < sc.max_dca and (price - self.next_price) * sign >= 0:
+            next_usdt = self.size_usdt * sc.volume_scale
+            if self._notional(price) + next_usdt <= sc.max_position_usdt + 1e-9:
+                prev_qty = self.pos_qty
+                self._side_order_fn(next_usdt / price, price)
+                filled = max(0.0, self.pos_qty - prev_qty)
+                if filled > 0:
+                    self.avg_entry = ((self.avg_entry * prev_qty) + price * filled) / self.pos_qty
+                    self.level += 1; self.size_usdt = next_usdt
+                    self._invalidate_targets()
+                    self.next_price = price * (1 + sign * self.dynamic_step())
+                    self.place_tp()
+                    logging.info("DCA %s L%d avg=%.6f next=%.6f", self._side_tag, self.level, self.avg_entry, self.next_price)
 
     def check_tp_and_flip(self, price: float, mark: float):
         # If tp_mode is maker limit, rely on exchange fill + sync_position
@@ -439,7 +644,7 @@ class DogeFlipAggressiveWinOnly:
                 self.close_short_market_guarded(px)
 
     def _start_cooldown(self):
-        self.cooldown_until = time.time() + self.cfg.guard.cooldown_seconds
+        self.cooldown_until = time.monotonic() + self.cfg.guard.cooldown_seconds
         logging.info("Cooldown for %d seconds", self.cfg.guard.cooldown_seconds)
 
     def _flip_side(self):
@@ -451,48 +656,135 @@ class DogeFlipAggressiveWinOnly:
             self.side = "long"
             logging.info("Next side=LONG  (RSI_D=%s <= %.1f).",
                          f"{rsi_d:.1f}" if rsi_d is not None else "NA", self.cfg.guard.prefer_short_rsi)
+        self._bind_side()
+
+    def _bind_side(self):
+        long = self.side == "long"
+        self._side_cfg = self.cfg.long if long else self.cfg.short
+        self._step_sign = -1.0 if long else 1.0   # DCA below entry for long, above for short
+        self._side_sign = -self._step_sign        # pnl sign of a price rise
+        self._side_order_fn = self.mkt_buy if long else self.mkt_sell
+        self._side_tag = "LONG" if long else "SHORT"
+        # win-only TP constants: exit fee divisor and minimum TP distance from entry
+        self._tp_fee_div = 1.0 - self.cfg.risk.taker_fee if long else 1.0 + self.cfg.risk.taker_fee
+        self._tp_floor_mult = 1.0 + self.cfg.long.tp_pct_floor if long else 1.0 - self.cfg.short.tp_pct_floor
 
     def _notional(self, price: float) -> float:
         return self.pos_qty * price
 
-    def _reset_position_state(self):
-        self.pos_qty = 0.0; self.avg_entry = None; self.level = -1
-        self.size_usdt = 0.0; self.next_price = None; self.entry_fees_paid_usd = 0.0
-        self.cancel_tp()
+    # streams
+    def start_streams(self, ws: WebSocket, ws_private: Optional[WebSocket] = None):
+        ws.ticker_stream(symbol=self.cfg.symbol, callback=self._on_ticker)
+        if ws_private is not None:
+            ws_private.position_stream(callback=self._on_position)
+
+    def _on_ticker(self, msg: dict):
+        # websocket thread; pybit merges deltas, so data is always a full ticker
+        d = msg.get("data") or {}
+        try:
+            last = float(d["lastPrice"]); mark = float(d.get("markPrice") or last)
+        except (KeyError, TypeError, ValueError):
+            return
+        try:
+            self._funding_rate = float(d["fundingRate"])
+        except (KeyError, TypeError, ValueError):
+            pass
+        self._px = (last, mark); self._t_last_tick = time.monotonic()
+        self._wake_loop()
+
+    def _on_position(self, msg: dict):
+        lst = [p for p in msg.get("data") or [] if p.get("symbol") == self.cfg.symbol]
+        if lst:
+            self._pos_pending = lst
+            self._wake_loop()
+
+    def _wake_loop(self):
+        if self._aloop is not None:
+            self._aloop.call_soon_threadsafe(self._wake.set)
 
     # main loop
-    def loop(self):
+    def step(self, price: float, mark: float):
+        if time.monotonic() < self.cooldown_until:
+            return
+
+        self.maybe_open_or_dca(price)
+        self._flush_ops()
+        self.check_tp_and_flip(price, mark)
+
+        # throttled heartbeat
+        now = time.monotonic()
+        if now - self._t_last_hb >= self.cfg.log.heartbeat_sec:
+            pnl = None
+            if self.avg_entry and self.pos_qty > 0:
+                pnl = self.expected_net_pnl(price)
+            rsi_d = self.get_daily_rsi()
+            logging.info("HB side=%s pos=%.0f avg=%.6f px=%.6f pnl≈%s rsiD=%s L=%d",
+                         self.side, self.pos_qty, self.avg_entry or 0.0, price,
+                         f"{pnl:.2f}" if pnl is not None else "NA",
+                         f"{rsi_d:.1f}" if rsi_d is not None else "NA",
+                         self.level)
+            self._t_last_hb = now
+
+    async def _consume(self):
+        # one consumer: pushes arriving while an order is in flight are coalesced.
+        # step/sync_position make blocking pybit calls, so they run in a worker thread
+        # (one at a time) and the loop keeps taking pushes meanwhile
         while True:
+            await self._wake.wait()
+            self._wake.clear()
+            rest, self._rest_pos = self._rest_pos, None
             try:
-                last, mark = self.last_mark()
-                price = (last + mark) / 2.0
+                if self._pos_pending is not None:
+                    # position first to catch maker TP fills; a push beats any REST snapshot
+                    lst, self._pos_pending = self._pos_pending, None
+                    await asyncio.to_thread(self.sync_position, lst)
+                elif rest is not None and rest[0] == self._orders_sent:
+                    await asyncio.to_thread(self.sync_position, rest[1])
+                if self._px is not None:
+                    last, mark = self._px
+                    await asyncio.to_thread(self.step, (last + mark) / 2.0, mark)
             except Exception as e:
-                logging.warning("Price fetch fail: %s", e); time.sleep(self.cfg.poll_sec); continue
-
-            # always sync first to catch maker TP fills
-            self.sync_position()
-
-            if time.time() < self.cooldown_until:
-                time.sleep(self.cfg.poll_sec); continue
+                logging.error("Step failed: %s", e)
 
-            self.maybe_open_or_dca(price)
-            self.check_tp_and_flip(price, mark)
-
-            # throttled heartbeat
-            now = time.time()
-            if now - self._t_last_hb >= self.cfg.log.heartbeat_sec:
-                pnl = None
-                if self.avg_entry and self.pos_qty > 0:
-                    pnl = self.expected_net_pnl(price)
-                rsi_d = self.get_daily_rsi()
-                logging.info("HB side=%s pos=%.0f avg=%.6f px=%.6f pnl≈%s rsiD=%s L=%d",
-                             self.side, self.pos_qty, self.avg_entry or 0.0, price,
-                             f"{pnl:.2f}" if pnl is not None else "NA",
-                             f"{rsi_d:.1f}" if rsi_d is not None else "NA",
-                             self.level)
-                self._t_last_hb = now
+    async def _watchdog(self):
+        t_sync = 0.0
+        next_tick = time.monotonic()
+        while True:
+            # independent reads go out together (pybit is blocking, so one thread each)
+            now = time.monotonic()
+            sent = self._orders_sent
+            names = []; jobs = []
+            if now - self._t_last_tick >= self.cfg.poll_sec:
+                names.append("px"); jobs.append(asyncio.to_thread(self.last_mark))
+            if now - t_sync >= self.cfg.reconcile_sec and self._position_poll_needed():
+                names.append("pos"); jobs.append(asyncio.to_thread(self.fetch_positions)); t_sync = now
+            if self._rsi_due():
+                names.append("rsi"); jobs.append(asyncio.to_thread(self.get_daily_rsi))
+            res = dict(zip(names, await asyncio.gather(*jobs, return_exceptions=True)))
+            px = res.get("px"); pos = res.get("pos")
+            if isinstance(px, Exception):
+                logging.warning("Price fetch fail: %s", px)
+            elif px is not None:
+                self._px = px; self._wake.set()
+            if isinstance(pos, Exception):
+                logging.warning("sync_position failed: %s", pos)
+            elif pos is not None:
+                self._rest_pos = (sent, pos.get("result", {}).get("list", [])); self._wake.set()
+            await asyncio.to_thread(self.keepalive)
+            # fixed cadence: subtract the time the fetches (and any retries) took
+            next_tick += self.cfg.poll_sec
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                next_tick = time.monotonic()   # stalled past a tick: restart the grid, don't burst
+                await asyncio.sleep(0)
 
-            time.sleep(self.cfg.poll_sec)
+    async def loop(self):
+        # event first: _wake_loop treats a set _aloop as "loop ready"
+        self._wake = asyncio.Event()
+        self._aloop = asyncio.get_running_loop()
+        await asyncio.gather(self._consume(), self._watchdog())
 
 # ---------------------- main ----------------------
 
@@ -504,8 +796,15 @@ def main():
 
     cfg = Config()  # Aggressive ~600 defaults + throttled logs + clean init
     http = HTTP(api_key=key, api_secret=sec, recv_window=cfg.recv_window)
+    # pybit already uses a requests.Session; size its pool and keep sockets alive
+    # explicitly so every call in loop() reuses one TLS connection to Bybit
+    http.client.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=0))
+    http.client.headers.update({"Connection": "keep-alive", "Keep-Alive": "timeout=90, max=1000"})
     bot = DogeFlipAggressiveWinOnly(http, cfg)
-    bot.loop()
+    ws = WebSocket(testnet=False, channel_type=cfg.category)
+    ws_private = WebSocket(testnet=False, channel_type="private", api_key=key, api_secret=sec)
+    bot.start_streams(ws, ws_private)
+    asyncio.run(bot.loop())
 
 if __name__ == "__main__":
     main()
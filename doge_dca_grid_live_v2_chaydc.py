@@ -1,33 +1,71 @@
 
 """
 DOGEUSDT DCA/Grid (No SL) — Bybit Unified Trading (v5) worker
+- Config.symbols: one ladder per symbol, sharing the HTTP session, both websockets and the loop.
 - Long-only, DCA safety orders on % drops, close all at small TP from avg.
 - Avoids opposite-direction positions (no short). One-Way mode enforced when possible.
 - Idempotent orders via orderLinkId, qty rounded to exchange step, leverage set.
 - Retries with exponential backoff on transient errors.
 - Reads BYBIT_API_KEY/BYBIT_API_SECRET (or fallback API_KEY/API_SECRET).
+- Prices are pushed by the public WebSocket ticker stream; REST polling is only
+  a fallback while the stream is silent.
+- Short-exposure check reads the private position stream; REST get_positions only
+  before the first answer or while that stream is disconnected.
+- Position qty and avg entry follow the private execution stream (actual fill qty
+  and price); new orders wait until earlier ones are reported.
+- Take-profit is a resting reduce-only limit sell at avg*(1+tp_pct), amended after
+  every fill; without the private stream a polled market close is used instead.
+- asyncio loop: REST calls run in worker threads, so ticks keep arriving while an
+  order is in flight; one consumer acts on the newest price once it returns.
+  A housekeeping task reconciles the local position with the exchange every 30s.
+- Lot-size filters are cached in ~/.cache/doge_dca/<SYMBOL>.json for 24h; a cached
+  start skips get_instruments_info and re-checks it in a background thread.
+
+Latency: Bybit's matching engine is in Singapore (AWS ap-southeast-1); run the bot
+there or nearby. Startup probes /v5/market/time and warns if p95 RTT > 50ms.
+Config.domain picks the API host: "bybit" (api.bybit.com) or "bytick" (api.bytick.com).
 
 Requirements:
   pip install pybit
+  pip install orjson   # optional, faster JSON parsing of REST responses
 
 ENV:
   BYBIT_API_KEY / API_KEY
   BYBIT_API_SECRET / API_SECRET
 """
 
-import os, time, math, uuid, logging
-from dataclasses import dataclass
+import os, json, math, time, hmac, hashlib, random, itertools, threading, queue, atexit, logging, asyncio
+from logging.handlers import QueueHandler, QueueListener
+from dataclasses import dataclass, replace
+from decimal import Decimal
 from typing import Optional, Callable, Any
-from pybit.unified_trading import HTTP
+from pybit.unified_trading import HTTP, WebSocket
+from pybit.exceptions import InvalidRequestError, FailedRequestError
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+try:
+    import orjson
+except ImportError:  # optional: faster parsing of REST responses
+    orjson = None
+
+# records are queued and written to stderr by a listener thread, so the event
+# loop only pays for a queue put, never for formatting or a blocking write
+class _RawQueueHandler(QueueHandler):
+    def prepare(self, record):
+        return record   # same-process queue: leave formatting to the listener thread
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s %(levelname)s: %(message)s"
-)
+_log_q = queue.SimpleQueue()
+logging.basicConfig(level=logging.INFO, handlers=[_RawQueueHandler(_log_q)])
+_log_out = logging.StreamHandler()
+_log_out.setFormatter(logging.Formatter("%(asctime)s %(levelname)s: %(message)s"))
+_log_listener = QueueListener(_log_q, _log_out)
+_log_listener.start()
+atexit.register(_log_listener.stop)
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Config:
     symbol: str = "DOGEUSDT"
+    symbols: tuple = ("DOGEUSDT",)  # main runs one ladder per symbol on shared HTTP/WS; caps are per symbol
     category: str = "linear"
     leverage: int = 3
     base_order_usdt: float = 10.0
@@ -37,179 +75,682 @@ class Config:
     tp_pct: float = 0.008     # 0.8% take-profit from avg entry
     max_position_usdt: float = 500.0
     poll_sec: float = 3.0
+    ws_stale_sec: float = 10.0  # REST price fallback only after the stream is silent this long
+    reconcile_sec: float = 30.0 # REST position check (manual closes, liquidation, missed fills)
+    fill_timeout_sec: float = 5.0  # stop waiting for an order's execution reports after this long
     recv_window: int = 60000  # 60s like in t1.py
+    domain: str = "bybit"     # "bytick" = alternate mainnet host, sometimes faster outside APAC
+    instruments_ttl_sec: float = 86400.0  # lot-size filters cached on disk this long
+
+_CACHE_DIR = os.path.expanduser("~/.cache/doge_dca")
+
+# orderLinkId counter shared by every ladder in the process; seeding from time_ns keeps ids unique across restarts
+_LINK_SEQ = itertools.count(time.time_ns())
+
+# execution types that move the position (funding and settlement don't)
+_FILL_EXEC_TYPES = {"Trade", "AdlTrade", "BustTrade"}
+
+# Bybit retCodes worth retrying: timestamp/recv_window, rate limit, internal error
+_TRANSIENT_RETCODES = {10002, 10006, 10016}
+
+def _is_transient(e: Exception) -> bool:
+    if isinstance(e, InvalidRequestError):   # status_code is Bybit's retCode
+        return e.status_code in _TRANSIENT_RETCODES
+    if isinstance(e, FailedRequestError):    # status_code is the HTTP status
+        return e.status_code not in (400, 401, 403)
+    return True                              # network errors, timeouts
 
 def with_retry(fn: Callable[..., Any], *args, **kwargs):
-    """Retry helper with exponential backoff (5 tries)."""
+    """Retry helper with capped, jittered exponential backoff (5 tries)."""
     tries = kwargs.pop("_tries", 5)
     for i in range(tries):
         try:
             return fn(*args, **kwargs)
         except Exception as e:
-            wait = 1.2 * (2 ** i)
+            # rejected orders, bad params or auth won't succeed on a retry
+            if i == tries - 1 or not _is_transient(e):
+                raise
+            wait = min(1.2 * (2 ** i) * random.uniform(0.8, 1.2), 5.0)
             logging.warning("API call failed (attempt %d/%d): %s; retrying in %.1fs",
                             i+1, tries, e, wait)
             time.sleep(wait)
-    # last try
-    return fn(*args, **kwargs)
+
+def use_orjson(http: HTTP):
+    """Parse pybit's REST responses with orjson, if installed."""
+    if orjson is None:
+        return
+    def _hook(r, *args, **kwargs):
+        r.json = lambda **kw: orjson.loads(r.content)
+        return r
+    # requests' public response hook; websocket frames stay on pybit's own json
+    # (patching its private module would break silently on a pybit upgrade)
+    http.client.hooks["response"].append(_hook)
+
+def use_fast_signer(http: HTTP):
+    """Sign requests from a pre-keyed HMAC-SHA256 copied per call instead of re-keying each time."""
+    if http.rsa_authentication or not http.api_key or not http.api_secret:
+        return
+    keyed = hmac.new(http.api_secret.encode("utf-8"), digestmod=hashlib.sha256)
+    api_key = http.api_key
+    def _auth(payload, recv_window, timestamp):
+        h = keyed.copy()
+        h.update(f"{timestamp}{api_key}{recv_window}{payload}".encode("utf-8"))
+        return h.hexdigest()
+    http._auth = _auth   # instance attribute shadows pybit's HTTP._auth
+
+def probe_latency(http: HTTP, n: int = 10, warn_ms: float = 50.0):
+    """Time n server-time calls and log min/avg/p95 RTT; also warms the connection pool."""
+    rtts = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        try:
+            http.get_server_time()
+        except Exception as e:
+            logging.warning("Latency probe failed: %s", e)
+            return
+        rtts.append((time.perf_counter() - t0) * 1000)
+    rtts.sort()
+    p95 = rtts[min(n - 1, int(n * 0.95))]
+    logging.info("REST RTT to %s: min=%.0fms avg=%.0fms p95=%.0fms", http.endpoint, rtts[0], sum(rtts) / n, p95)
+    if p95 > warn_ms:
+        logging.warning("p95 RTT %.0fms > %.0fms; consider running closer to Bybit (Singapore, AWS ap-southeast-1).",
+                        p95, warn_ms)
 
 class DogeDCA:
+    # fixed attribute set: slot reads on the tick path, smaller instances per symbol
+    __slots__ = (
+        "http", "cfg",
+        "level", "next_buy_price", "avg_entry", "pos_qty",
+        "_tp_mult", "_tp_price", "_capped", "_cap_px", "_level_usdt", "_step_down", "_drop",
+        "last_price_cached", "_last_tick", "_stale", "_has_short", "_ws_private",
+        "_open_links", "_fill_wait_t", "_await_rest", "_pause_until", "_tp", "_tp_retry_t",
+        "_orders_sent", "_pos_pending", "_aloop", "_tick", "_log_info",
+        "_cache_path", "_lot_filter", "_lot_pending", "qty_step", "min_qty",
+        "_qty_scale", "_qty_step_int", "_qty_fmt", "_px_scale", "_tick_int", "_px_fmt",
+    )
+
     def __init__(self, http: HTTP, cfg: Config):
         self.http = http
         self.cfg = cfg
 
         # internal state
         self.level = -1
-        self.size_usdt = cfg.base_order_usdt
         self.next_buy_price: Optional[float] = None
         self.avg_entry: Optional[float] = None
         self.pos_qty: float = 0.0
+        # TP trigger cached whenever avg_entry changes (_set_avg), not recomputed per tick
+        self._tp_mult = 1 + cfg.tp_pct
+        self._tp_price: Optional[float] = None
+        # no more safety orders: ladder used up (until reset), or the next rung only
+        # fits under max_position_usdt at or below _cap_px (until the position changes)
+        self._capped = False
+        self._cap_px = float("inf")
 
-        # read instrument filters and set leverage/mode
-        info = with_retry(self.http.get_instruments_info, category=cfg.category, symbol=cfg.symbol)
-        lot_size_filter = info["result"]["list"][0]["lotSizeFilter"]
-        self.qty_step = float(lot_size_filter["qtyStep"])
-        self.min_qty = float(lot_size_filter["minOrderQty"])
+        # ladder schedule built once: USDT size per level, and the price factor for
+        # the rung k steps below next_buy_price (rungs stay relative to the last fill)
+        self._level_usdt = tuple(cfg.base_order_usdt * cfg.volume_scale ** i for i in range(cfg.safety_orders))
+        self._step_down = 1 - cfg.step_pct
+        self._drop = tuple(self._step_down ** k for k in range(10))  # place_batch_order takes at most 10
+
+        # latest pushed price; _tick wakes the consumer on the asyncio loop
+        self.last_price_cached: Optional[float] = None
+        self._last_tick = 0.0
+        self._stale = False
+
+        # short-exposure flag kept current by the private position stream
+        self._has_short: Optional[bool] = None
+        self._ws_private: Optional[WebSocket] = None
+
+        # pos_qty/avg_entry move only on execution reports; orders sent but not yet
+        # fully reported are tracked by orderLinkId and hold off new decisions
+        self._open_links: dict = {}
+        self._fill_wait_t = 0.0
+        self._await_rest = False  # reports timed out: no new orders until a REST snapshot is adopted
+        self._pause_until = 0.0   # back-off after a failed order
+
+        # resting reduce-only TP limit (orderLinkId, qty left, price), only with the execution stream
+        self._tp: Optional[list] = None
+        self._tp_retry_t = 0.0
+
+        # reconcile snapshot handed to the consumer, tagged with the order count at fetch time
+        self._orders_sent = 0
+        self._pos_pending: Optional[tuple] = None
+        self._aloop: Optional[asyncio.AbstractEventLoop] = None
+        self._tick: Optional[asyncio.Event] = None
+
+        # level is fixed by basicConfig at import, so check it once instead of
+        # building the order-path log records when running at WARNING
+        self._log_info = logging.getLogger().isEnabledFor(logging.INFO)
+
+        # read instrument filters (disk cache first, REST re-checks it in the background) and set leverage/mode
+        self._cache_path = os.path.join(_CACHE_DIR, cfg.symbol + ".json")
+        self._lot_pending: Optional[dict] = None   # refreshed filters, applied by the consumer
+        cached = self._load_lot_filter()
+        self._apply_lot_filter(cached or self._fetch_lot_filter())
+        if cached is not None:
+            threading.Thread(target=self._refresh_lot_filter, daemon=True).start()
 
         # Switch to One-Way (avoid opposite direction) — ignore if already one-way or not supported
         try:
             with_retry(self.http.switch_position_mode, category=cfg.category, symbol=cfg.symbol, mode="OneWay")
-            logging.info("Position mode: One-Way")
+            logging.info("%s position mode: One-Way", cfg.symbol)
         except Exception as e:
-            logging.warning("Cannot switch to One-Way mode (may already be One-Way): %s", e)
+            logging.warning("%s: cannot switch to One-Way mode (may already be One-Way): %s", cfg.symbol, e)
 
         # Set leverage
         try:
             with_retry(self.http.set_leverage, category=cfg.category, symbol=cfg.symbol,
                        buyLeverage=str(cfg.leverage), sellLeverage=str(cfg.leverage))
-            logging.info("Leverage set to %dx", cfg.leverage)
+            logging.info("%s leverage set to %dx", cfg.symbol, cfg.leverage)
         except Exception as e:
-            logging.warning("Cannot set leverage: %s", e)
+            logging.warning("%s: cannot set leverage: %s", cfg.symbol, e)
 
     # ---------- helpers ----------
+    def _apply_lot_filter(self, lot_size_filter: dict):
+        self.qty_step = float(lot_size_filter["qtyStep"])
+        self.min_qty = float(lot_size_filter["minOrderQty"])
+        # qty is floored in scaled integers (units of 10**-decimals), parsed exactly
+        # from the step string, plus a fixed-decimals format so order qty strings
+        # never carry float noise (e.g. 30.000000000000004)
+        step = Decimal(lot_size_filter["qtyStep"]).normalize()
+        decimals = max(0, -step.as_tuple().exponent)
+        self._qty_scale = 10 ** decimals
+        self._qty_step_int = int(step * self._qty_scale)
+        self._qty_fmt = "{:.%df}" % decimals
+        # same for the TP limit price, on the tick grid
+        tick = Decimal(lot_size_filter["tickSize"]).normalize()
+        decimals = max(0, -tick.as_tuple().exponent)
+        self._px_scale = 10 ** decimals
+        self._tick_int = int(tick * self._px_scale)
+        self._px_fmt = "{:.%df}" % decimals
+        self._lot_filter = lot_size_filter
+
+    def _load_lot_filter(self) -> Optional[dict]:
+        try:
+            with open(self._cache_path) as f:
+                c = json.load(f)
+            if time.time() - c["ts"] < self.cfg.instruments_ttl_sec and "tickSize" in c["lotSizeFilter"]:
+                return c["lotSizeFilter"]
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        return None
+
+    def _fetch_lot_filter(self) -> dict:
+        info = with_retry(self.http.get_instruments_info, category=self.cfg.category, symbol=self.cfg.symbol)
+        inst = info["result"]["list"][0]
+        f = inst["lotSizeFilter"]
+        lot_size_filter = {"qtyStep": f["qtyStep"], "minOrderQty": f["minOrderQty"],
+                           "tickSize": inst["priceFilter"]["tickSize"]}
+        try:
+            os.makedirs(_CACHE_DIR, exist_ok=True)
+            tmp = self._cache_path + ".tmp"
+            with open(tmp, "w") as fh:
+                json.dump({"lotSizeFilter": lot_size_filter, "ts": time.time()}, fh)
+            os.replace(tmp, self._cache_path)
+        except OSError as e:
+            logging.warning("Cannot write instruments cache %s: %s", self._cache_path, e)
+        return lot_size_filter
+
+    def _refresh_lot_filter(self):
+        # background check of the cached filters; adopt them if the exchange changed them
+        try:
+            lot_size_filter = self._fetch_lot_filter()
+        except Exception as e:
+            logging.warning("Instruments refresh failed (keeping cached filters): %s", e)
+            return
+        if lot_size_filter != self._lot_filter:
+            logging.warning("%s lot-size filters changed %s -> %s", self.cfg.symbol, self._lot_filter, lot_size_filter)
+            # round_qty/ceil_px read several fields on the loop: swap them there, between orders
+            self._lot_pending = lot_size_filter
+
     def round_qty(self, q: float) -> float:
-        step = self.qty_step
         # floor to step, then ensure >= min_qty if > 0
-        q = math.floor(q / step) * step
-        if q > 0 and q < self.min_qty:
+        # (1e-9 absorbs products like 0.7*10 landing just under an exact multiple)
+        q_int = int(q * self._qty_scale + 1e-9)
+        q = (q_int - q_int % self._qty_step_int) / self._qty_scale
+        if 0 < q < self.min_qty:
             q = self.min_qty
         return q
 
+    def ceil_px(self, p: float) -> float:
+        # round up to tick so the TP never sits below avg * (1 + tp_pct)
+        p_int = math.ceil(p * self._px_scale - 1e-9)
+        return -(-p_int // self._tick_int) * self._tick_int / self._px_scale
+
+    def _link(self) -> str:
+        return f"dca-{next(_LINK_SEQ)}"
+
     def last_price(self) -> float:
         r = with_retry(self.http.get_tickers, category=self.cfg.category, symbol=self.cfg.symbol)
         return float(r["result"]["list"][0]["lastPrice"])
 
-    def has_short(self) -> bool:
+    def _on_position(self, msg: dict):
+        lst = [p for p in msg.get("data") or [] if p.get("symbol") == self.cfg.symbol]
+        if lst:
+            self._has_short = self._short_in(lst)
+
+    def _on_execution(self, msg: dict):
+        # runs on pybit's websocket thread; fills are applied on the asyncio loop
+        try:
+            fills = [(e["side"], float(e["execQty"]), float(e["execPrice"]), e.get("orderLinkId"))
+                     for e in msg.get("data") or []
+                     if e.get("symbol") == self.cfg.symbol and e.get("execType", "Trade") in _FILL_EXEC_TYPES]
+        except (KeyError, TypeError, ValueError):
+            return
+        if not fills:
+            return
+        if self._aloop is None:
+            for f in fills:
+                self._apply_fill(*f)
+            return
+        # no wake-up here: the consumer re-evaluates on the next price, not on a fill
+        self._aloop.call_soon_threadsafe(self._on_fills, fills)
+
+    def _on_fills(self, fills: list):
+        for f in fills:
+            self._apply_fill(*f)
+
+    def _apply_fill(self, side: str, qty: float, price: float, link: Optional[str] = None):
+        rem = self._open_links.get(link)
+        if rem is not None:
+            if rem - qty < self.qty_step / 2:
+                del self._open_links[link]
+            else:
+                self._open_links[link] = rem - qty
+        if self._tp is not None and link == self._tp[0]:
+            self._tp[1] -= qty
+        self._cap_px = float("inf")
+        if side == "Buy":
+            new_qty = self.pos_qty + qty
+            if self.avg_entry is None or self.pos_qty <= 0:
+                self._set_avg(price)
+            else:
+                self._set_avg((self.avg_entry * self.pos_qty + price * qty) / new_qty)
+            self.pos_qty = new_qty
+        else:
+            self.pos_qty -= qty
+            if self.pos_qty < self.qty_step / 2:
+                self._reset_ladder()
+
+    def _set_avg(self, avg: Optional[float]):
+        self.avg_entry = avg
+        self._tp_price = None if avg is None else avg * self._tp_mult
+
+    def _fills_streamed(self) -> bool:
+        # execution reports only arrive while the private socket is up; otherwise
+        # orders are assumed filled at the tick price and REST reconciles them
+        ws = self._ws_private
+        return ws is not None and ws.is_connected()
+
+    def _expect(self, link: str, qty: float):
+        # registered before the request goes out: the report can beat the REST reply
+        self._open_links[link] = qty
+        self._fill_wait_t = time.monotonic()
+
+    @staticmethod
+    def _short_in(lst: list) -> bool:
+        for p in lst:
+            side = (p.get("side") or "").lower()
+            sz = float(p.get("size") or p.get("cumSize") or 0)
+            if side == "sell" or sz < 0:
+                return True
+        return False
+
+    def _on_tick(self, msg: dict):
+        # runs on pybit's websocket thread: record the price, wake the loop
+        try:
+            price = float(msg["data"]["lastPrice"])
+        except (KeyError, TypeError, ValueError):
+            return
+        self.last_price_cached = price
+        self._last_tick = time.monotonic()
+        if self._aloop is not None:
+            self._aloop.call_soon_threadsafe(self._tick.set)
+
+    async def has_short(self) -> bool:
         """Detect if any short exposure exists; skip longs to avoid opposite direction."""
+        if self._has_short is not None and self._ws_private is not None and self._ws_private.is_connected():
+            return self._has_short
         try:
-            r = with_retry(self.http.get_positions, category=self.cfg.category, symbol=self.cfg.symbol)
-            lst = r.get("result", {}).get("list", [])
-            for p in lst:
-                side = (p.get("side") or "").lower()
-                sz = float(p.get("size") or p.get("cumSize") or 0)
-                if side == "sell" or sz < 0:
-                    return True
+            r = await asyncio.to_thread(with_retry, self.http.get_positions,
+                                        category=self.cfg.category, symbol=self.cfg.symbol)
+            self._has_short = self._short_in(r.get("result", {}).get("list", []))
+            return self._has_short
         except Exception as e:
             logging.warning("get_positions failed: %s", e)
         return False
 
-    def market_buy(self, qty: float):
+    async def market_buy(self, qty: float, price: float) -> int:
+        """Send one market buy; returns 1 if it went out, 0 if qty rounded to nothing."""
         qty = self.round_qty(qty)
         if qty <= 0:
-            logging.info("Qty < min; skip buy.")
-            return
-        link_id = str(uuid.uuid4())
-        with_retry(self.http.place_order,
-                   category=self.cfg.category,
-                   symbol=self.cfg.symbol,
-                   side="Buy",
-                   orderType="Market",
-                   qty=str(qty),
-                   reduceOnly=False,
-                   orderLinkId=link_id)
-        self.pos_qty += qty
-        logging.info("BUY market %s qty=%s link=%s", self.cfg.symbol, qty, link_id)
-
-    def market_sell_all(self):
+            if self._log_info:
+                logging.info("Qty < min; skip buy.")
+            return 0
+        link_id = self._link()
+        streamed = self._fills_streamed()
+        if streamed:
+            self._expect(link_id, qty)
+        await asyncio.to_thread(with_retry, self.http.place_order,
+                                category=self.cfg.category,
+                                symbol=self.cfg.symbol,
+                                side="Buy",
+                                orderType="Market",
+                                qty=self._qty_fmt.format(qty),
+                                reduceOnly=False,
+                                orderLinkId=link_id)
+        self._orders_sent += 1
+        if not streamed:
+            self._apply_fill("Buy", qty, price)  # no execution stream: assume filled at the tick price
+        if self._log_info:
+            logging.info("BUY market %s qty=%s link=%s", self.cfg.symbol, qty, link_id)
+        return 1
+
+    async def market_buy_batch(self, qtys: list, price: float) -> int:
+        """Send several market buys in one place_batch_order; returns how many were accepted."""
+        legs = [(q, self._link()) for q in map(self.round_qty, qtys) if q > 0]
+        if not legs:
+            return 0
+        streamed = self._fills_streamed()
+        if streamed:
+            for q, link in legs:
+                self._expect(link, q)
+        r = await asyncio.to_thread(with_retry, self.http.place_batch_order,
+                                    category=self.cfg.category,
+                                    request=[dict(symbol=self.cfg.symbol, side="Buy", orderType="Market",
+                                                  qty=self._qty_fmt.format(q), reduceOnly=False,
+                                                  orderLinkId=link) for q, link in legs])
+        self._orders_sent += 1
+        codes = r.get("retExtInfo", {}).get("list", [])
+        n = 0
+        for i, (q, link) in enumerate(legs):
+            if i < len(codes) and codes[i].get("code", 0) != 0:
+                logging.warning("Batch buy %s rejected: %s", link, codes[i].get("msg"))
+                self._open_links.pop(link, None)
+                continue
+            if not streamed:
+                self._apply_fill("Buy", q, price)
+            n += 1
+            if self._log_info:
+                logging.info("BUY market %s qty=%s link=%s", self.cfg.symbol, q, link)
+        return n
+
+    async def market_sell_all(self, price: float):
         if self.pos_qty <= 0:
             return
         qty = self.round_qty(self.pos_qty)
-        link_id = str(uuid.uuid4())
-        with_retry(self.http.place_order,
-                   category=self.cfg.category,
-                   symbol=self.cfg.symbol,
-                   side="Sell",
-                   orderType="Market",
-                   qty=str(qty),
-                   reduceOnly=True,   # close long only
-                   orderLinkId=link_id)
-        logging.info("SELL market (close) %s qty=%s link=%s", self.cfg.symbol, qty, link_id)
-        self.pos_qty = 0.0
+        link_id = self._link()
+        streamed = self._fills_streamed()
+        if streamed:
+            self._expect(link_id, qty)
+        await asyncio.to_thread(with_retry, self.http.place_order,
+                                category=self.cfg.category,
+                                symbol=self.cfg.symbol,
+                                side="Sell",
+                                orderType="Market",
+                                qty=self._qty_fmt.format(qty),
+                                reduceOnly=True,   # close long only
+                                orderLinkId=link_id)
+        self._orders_sent += 1
+        if self._log_info:
+            logging.info("SELL market (close) %s qty=%s link=%s", self.cfg.symbol, qty, link_id)
+        if not streamed:
+            self._apply_fill("Sell", qty, price)
 
     # ---------- core logic ----------
-    def open_base_if_flat(self, price: float):
+    async def open_base_if_flat(self, price: float):
+        if self.pos_qty != 0:
+            return
+
         # Avoid opposite direction exposure (no short allowed)
-        if self.has_short():
-            logging.warning("Detected short exposure; skip opening long to avoid opposite directions.")
+        if await self.has_short():
+            logging.warning("%s: detected short exposure; skip opening long to avoid opposite directions.", self.cfg.symbol)
+            return
+
+        notional = self.cfg.base_order_usdt
+        if notional > self.cfg.max_position_usdt:
+            logging.warning("%s: base order exceeds max position cap. Skipping.", self.cfg.symbol)
             return
+        qty = notional / price
+        if not await self.market_buy(qty, price):
+            return
+        self.level = 0
+        self.next_buy_price = price * self._step_down
+        if self._log_info:
+            logging.info("Opened base %s: price=%.6f next_buy=%.6f", self.cfg.symbol, price, self.next_buy_price)
 
+    async def add_safety_if_needed(self, price: float):
+        if self._capped or self.next_buy_price is None or price > self.next_buy_price or price > self._cap_px:
+            return
+        lvl = self.level + 1
+        if lvl >= self.cfg.safety_orders:
+            self._capped = True
+            if self._log_info:
+                logging.info("%s: all %d safety orders used; no more adds until TP.", self.cfg.symbol, self.cfg.safety_orders)
+            return
+        # every rung price has already fallen through (ticks coalesced while an
+        # order was in flight) is bought in one request; each rung is step_pct below the last
+        sizes = []
+        trigger = self.next_buy_price
+        cap = self.cfg.max_position_usdt + 1e-9
+        notional = self.pos_qty * price
+        for k in range(min(self.cfg.safety_orders - lvl, len(self._drop))):
+            u = self._level_usdt[lvl + k]
+            if price > trigger * self._drop[k]:
+                break
+            if notional + u > cap:
+                if not sizes:
+                    # notional only shrinks as price falls: the rung fits once pos_qty*price <= cap - u
+                    self._cap_px = (cap - u) / self.pos_qty if cap > u and self.pos_qty > 0 else 0.0
+                break
+            sizes.append(u)
+            notional += u
+        if sizes:
+            # execute buy; avg_entry follows the execution reports
+            if len(sizes) == 1:
+                n = await self.market_buy(sizes[0] / price, price)
+            else:
+                n = await self.market_buy_batch([u / price for u in sizes], price)
+            if n:
+                self.level += n
+                self.next_buy_price = price * self._step_down
+                if self._log_info:
+                    logging.info("Added safety %s L%d price=%.6f next_buy=%.6f", self.cfg.symbol, self.level, price, self.next_buy_price)
+
+    async def sync_tp(self):
+        """Keep one reduce-only limit sell resting at avg_entry*(1+tp_pct) for the whole position."""
+        if self.pos_qty <= 0 or self._tp_price is None or time.monotonic() < self._tp_retry_t:
+            return
+        if not self._fills_streamed():
+            return   # a resting TP's fill would go unreported; _on_price closes at market instead
+        qty = self.round_qty(self.pos_qty)
+        px = self.ceil_px(self._tp_price)
+        tp = self._tp
+        if qty <= 0 or (tp is not None and abs(tp[1] - qty) < self.qty_step / 2 and tp[2] == px):
+            return
+        try:
+            if tp is not None:
+                # amend in place: no window without a TP, and one request instead of cancel + place
+                await asyncio.to_thread(with_retry, self.http.amend_order,
+                                        category=self.cfg.category, symbol=self.cfg.symbol,
+                                        orderLinkId=tp[0], qty=self._qty_fmt.format(qty),
+                                        price=self._px_fmt.format(px))
+                tp[1], tp[2] = qty, px
+            else:
+                link_id = self._link()
+                await asyncio.to_thread(with_retry, self.http.place_order,
+                                        category=self.cfg.category, symbol=self.cfg.symbol,
+                                        side="Sell", orderType="Limit", timeInForce="GTC",
+                                        qty=self._qty_fmt.format(qty), price=self._px_fmt.format(px),
+                                        reduceOnly=True, orderLinkId=link_id)
+                self._tp = [link_id, qty, px]
+        except Exception as e:
+            # amend fails once the old TP filled or was cancelled; place a fresh one next time
+            logging.warning("%s TP order update failed: %s", self.cfg.symbol, e)
+            if tp is not None:
+                try:  # in case it is still resting after all (e.g. the reply was lost)
+                    await asyncio.to_thread(self.http.cancel_order, category=self.cfg.category,
+                                            symbol=self.cfg.symbol, orderLinkId=tp[0])
+                except Exception:
+                    pass
+            self._tp = None
+            self._tp_retry_t = time.monotonic() + self.cfg.poll_sec
+            return
+        self._orders_sent += 1
+        if self._log_info:
+            logging.info("TP %s limit sell qty=%s @ %s", self.cfg.symbol, qty, self._px_fmt.format(px))
+
+    async def tp_if_reached(self, price: float):
+        if self.pos_qty > 0 and self._tp_price is not None and price >= self._tp_price:
+            if self._log_info:
+                logging.info("TP hit %s: price=%.6f avg=%.6f", self.cfg.symbol, price, self.avg_entry)
+            await self.market_sell_all(price)  # ladder resets when the close is reported
+
+    async def _consume(self):
+        # Single consumer, so only one order is ever in flight. Ticks that land
+        # meanwhile just overwrite last_price_cached and are coalesced.
+        while True:
+            await self._tick.wait()
+            self._tick.clear()
+            if self._lot_pending is not None:
+                lot, self._lot_pending = self._lot_pending, None
+                self._apply_lot_filter(lot)
+            if self._pos_pending is not None:
+                snap, self._pos_pending = self._pos_pending, None
+                self._reconcile(*snap)
+            price = self.last_price_cached
+            if price is None:
+                continue
+            if self._open_links:
+                # act on confirmed position only; an order that never reports in full
+                # (e.g. partially filled, rest cancelled) is left to the reconcile
+                if time.monotonic() - self._fill_wait_t < self.cfg.fill_timeout_sec:
+                    continue
+                logging.warning("No full execution report for %s after %.0fs; holding orders until the next position check.",
+                                list(self._open_links), self.cfg.fill_timeout_sec)
+                self._open_links.clear()
+                self._await_rest = True   # pos_qty may be missing those fills: buying again could double the position
+            if self._await_rest or time.monotonic() < self._pause_until:
+                continue
+            try:
+                await self._on_price(price)
+            except Exception as e:
+                # one symbol's rejected order (margin, limits, ...) must not stop the other ladders;
+                # links registered this pass belong to the failed request (the gate above left none open)
+                logging.error("%s order failed: %s; pausing %.0fs", self.cfg.symbol, e, self.cfg.poll_sec)
+                self._open_links.clear()
+                self._pause_until = time.monotonic() + self.cfg.poll_sec
+
+    async def _on_price(self, price: float):
+        # one pass per tick; at most one of open / close / add applies to a given state
+        streamed = self._fills_streamed()
         if self.pos_qty == 0:
-            notional = self.cfg.base_order_usdt
-            if notional > self.cfg.max_position_usdt:
-                logging.warning("Base order exceeds max position cap. Skipping.")
+            await self.open_base_if_flat(price)
+        elif not streamed:
+            # no fill reports: close with a market order on a polled cross
+            tp = self._tp_price
+            if tp is not None and price >= tp:
+                await self.tp_if_reached(price)
                 return
-            qty = notional / price
-            self.market_buy(qty)
-            self.avg_entry = price
-            self.level = 0
-            self.size_usdt = self.cfg.base_order_usdt
-            self.next_buy_price = price * (1 - self.cfg.step_pct)
-            logging.info("Opened base: avg=%.6f next_buy=%.6f", self.avg_entry, self.next_buy_price)
-
-    def add_safety_if_needed(self, price: float):
-        if self.next_buy_price is None or self.level + 1 >= self.cfg.safety_orders:
-            return
-        current_notional = self.pos_qty * price
-        next_usdt = self.size_usdt * self.cfg.volume_scale
-        if price <= self.next_buy_price and current_notional + next_usdt <= self.cfg.max_position_usdt + 1e-9:
-            qty = next_usdt / price
-            # execute buy
-            prev_qty = self.pos_qty
-            self.market_buy(qty)
-            new_qty = self.pos_qty
-            filled = max(0.0, new_qty - prev_qty)
-            if filled > 0:
-                # update avg entry
-                self.avg_entry = ((self.avg_entry * prev_qty) + price * filled) / new_qty
-                self.level += 1
-                self.size_usdt = next_usdt
-                self.next_buy_price = price * (1 - self.cfg.step_pct)
-                logging.info("Added safety L%d avg=%.6f next_buy=%.6f", self.level, self.avg_entry, self.next_buy_price)
-
-    def tp_if_reached(self, price: float):
-        if self.pos_qty > 0 and price >= self.avg_entry * (1 + self.cfg.tp_pct):
-            logging.info("TP hit: price=%.6f avg=%.6f", price, self.avg_entry)
-            self.market_sell_all()
-            # reset state
-            self.level = -1
-            self.size_usdt = self.cfg.base_order_usdt
-            self.next_buy_price = None
-            self.avg_entry = None
-
-    def loop(self):
+        nb = self.next_buy_price
+        if nb is not None and price <= nb and price <= self._cap_px and not self._capped:
+            await self.add_safety_if_needed(price)
+        if streamed and not self._open_links:
+            await self.sync_tp()
+
+    async def _watchdog(self):
+        # staleness check only: trading is driven by _on_tick; REST fills in while the stream is silent
         while True:
+            await asyncio.sleep(self.cfg.poll_sec)
+            if time.monotonic() - self._last_tick < self.cfg.ws_stale_sec:
+                if self._stale:
+                    logging.info("%s ticker stream resumed.", self.cfg.symbol)
+                    self._stale = False
+                continue
+            if not self._stale:
+                logging.warning("%s ticker stream silent for %.0fs; polling REST.", self.cfg.symbol, self.cfg.ws_stale_sec)
+                self._stale = True
             try:
-                price = self.last_price()
+                self.last_price_cached = await asyncio.to_thread(self.last_price)
             except Exception as e:
-                logging.warning("Price fetch failed: %s", e)
-                time.sleep(self.cfg.poll_sec)
+                logging.warning("%s price fetch failed: %s", self.cfg.symbol, e)
                 continue
+            self._tick.set()
+
+    def _reset_ladder(self):
+        self.pos_qty = 0.0
+        self._tp = None   # filled, or cancelled by the exchange with the position
+        self.level = -1
+        self.next_buy_price = None
+        self._set_avg(None)
+        self._capped = False
+        self._cap_px = float("inf")
+
+    def _reconcile(self, orders_at_fetch: int, lst: list):
+        if orders_at_fetch != self._orders_sent or self._open_links:
+            return  # an order went out after the snapshot was taken or is still unreported; wait for the next one
+        if self._await_rest:
+            logging.info("%s position check adopted; resuming orders.", self.cfg.symbol)
+            self._await_rest = False
+        self._has_short = self._short_in(lst)
+        size = 0.0; avg = None
+        for p in lst:
+            if (p.get("side") or "").lower() == "buy" and float(p.get("size") or 0) > 0:
+                size = float(p["size"]); avg = float(p.get("avgPrice") or 0) or None
+        if size == 0 and self.pos_qty > 0:
+            logging.warning("%s: exchange reports no long position; resetting ladder (was qty=%s).", self.cfg.symbol, self.pos_qty)
+            self._reset_ladder()
+        elif size > 0 and abs(size - self.pos_qty) >= self.qty_step / 2:
+            logging.warning("%s position drift: local qty=%s exchange qty=%s; adopting exchange.", self.cfg.symbol, self.pos_qty, size)
+            self.pos_qty = size
+            self._cap_px = float("inf")
+            if avg is not None:
+                self._set_avg(avg)
+                if self.level < 0:   # fills we never saw opened it: resume the ladder from the exchange's entry
+                    self.level = 0
+                    self.next_buy_price = avg * self._step_down
+
+    async def _housekeeping(self):
+        while True:
+            await asyncio.sleep(self.cfg.reconcile_sec)
+            sent = self._orders_sent
+            try:
+                r = await asyncio.to_thread(with_retry, self.http.get_positions,
+                                            category=self.cfg.category, symbol=self.cfg.symbol)
+            except Exception as e:
+                logging.warning("%s reconcile failed: %s", self.cfg.symbol, e)
+                continue
+            self._pos_pending = (sent, r.get("result", {}).get("list", []))
+            self._tick.set()
+
+    async def loop(self):
+        # event first: _on_tick treats a set _aloop as "loop ready" and calls _tick.set
+        self._tick = asyncio.Event()
+        self._aloop = asyncio.get_running_loop()
+        if self.last_price_cached is not None:
+            self._tick.set()
+        await asyncio.gather(self._consume(), self._watchdog(), self._housekeeping())
 
-            self.open_base_if_flat(price)
-            self.tp_if_reached(price)
-            self.add_safety_if_needed(price)
+def start_streams(bots: list, ws: WebSocket, ws_private: Optional[WebSocket] = None):
+    """Subscribe every ladder on one public and one private connection."""
+    for b in bots:
+        ws.ticker_stream(symbol=b.cfg.symbol, callback=b._on_tick)  # topic tickers.<symbol>, routed by pybit
+    if ws_private is None:
+        return
+    # position/execution are one topic per account: fan out, each bot filters its own symbol
+    def on_position(msg):
+        for b in bots:
+            b._on_position(msg)
+    def on_execution(msg):
+        for b in bots:
+            b._on_execution(msg)
+    ws_private.position_stream(callback=on_position)
+    ws_private.execution_stream(callback=on_execution)
+    for b in bots:
+        b._ws_private = ws_private
 
-            time.sleep(self.cfg.poll_sec)
+async def run_bots(bots: list):
+    await asyncio.gather(*(b.loop() for b in bots))
 
 def main():
     key = os.environ.get("BYBIT_API_KEY") or os.environ.get("API_KEY")
@@ -217,9 +758,19 @@ def main():
     if not key or not sec:
         raise SystemExit("Set BYBIT_API_KEY/BYBIT_API_SECRET (hoặc API_KEY/API_SECRET)")
 
-    http = HTTP(api_key=key, api_secret=sec, recv_window=Config.recv_window)
-    bot = DogeDCA(http, Config())
-    bot.loop()
+    cfg = Config()
+    http = HTTP(api_key=key, api_secret=sec, recv_window=cfg.recv_window, domain=cfg.domain)
+    # one warm pool of TLS connections; retries stay in with_retry
+    http.client.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=10, max_retries=Retry(total=0)))
+    http.client.headers.update({"Connection": "keep-alive"})
+    use_orjson(http)
+    use_fast_signer(http)
+    probe_latency(http)
+    ws = WebSocket(testnet=False, channel_type=cfg.category, domain=cfg.domain)
+    ws_private = WebSocket(testnet=False, channel_type="private", api_key=key, api_secret=sec, domain=cfg.domain)
+    bots = [DogeDCA(http, replace(cfg, symbol=sym)) for sym in cfg.symbols]
+    start_streams(bots, ws, ws_private)
+    asyncio.run(run_bots(bots))
 
 if __name__ == "__main__":
     main()